@@ -1,46 +1,71 @@
 import argparse
-import subprocess
+import os
 import sys
-import time
+from pathlib import Path
 
 
-def record_script(script, args, output_filename):
-    # Start the Python script
-    script_process = subprocess.Popen([sys.executable, script] + args)
-    time.sleep(1)
+def parse_size(size: str) -> tuple[int, int]:
+    width, height = size.lower().split("x")
+    return int(width), int(height)
 
-    # Updated ffmpeg command to use the specified audio source
-    ffmpeg_command = [
-        'ffmpeg',
-        '-y',  # Overwrite existing files
-        '-f', 'x11grab',
-        '-video_size', f"{1920}x{1020}",  # Use actual window size
-        '-r', '60',  # Set frame rate to 60 FPS
-        '-i', f":0.0+{0},{0}",  # Use actual window position
-        '-f', 'pulse', '-ac', '2', 
-        '-i', 'alsa_output.pci-0000_00_1f.3.analog-stereo.monitor',  # Specified audio source
-        '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
-        output_filename
-    ]
 
-    recording_process = subprocess.Popen(ffmpeg_command)
+def main():
+    sys.path.insert(0, str(Path(__file__).parent / "source"))
+    from inference_backends import BACKENDS
+    from pitch_decoders import DECODERS
+    from pitch_engines import ENGINES
 
-    # Wait for the Python script to finish
-    script_process.wait()
+    parser = argparse.ArgumentParser(
+        description="Render a video of the visualisation without a display"
+    )
+    parser.add_argument("output", help="Output MP4 filename")
+    parser.add_argument("audio", help="Path to the .wav file")
+    parser.add_argument(
+        "--size", type=parse_size, default="1920x1080", help="Video size as WIDTHxHEIGHT"
+    )
+    parser.add_argument("--fps", type=int, default=60, help="Frames per second")
+    parser.add_argument(
+        "--preset", default="veryfast", help="x264 preset passed to ffmpeg"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="crepe-full",
+        help="Pitch engine to extract with",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="torchcrepe",
+        help="Inference backend of the pitch extraction",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default="viterbi",
+        help="Decoder of the CREPE pitch probabilities",
+    )
+    args = parser.parse_args()
 
-    # Stop the recording
-    recording_process.terminate()
-    recording_process.wait()
+    # Render off-screen, no window or sound card needed
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    from controller.video_renderer import render_video
+    from model import ExtractionParameters
 
+    width, height = args.size
+    render_video(
+        args.audio,
+        args.output,
+        width,
+        height,
+        args.fps,
+        args.preset,
+        ExtractionParameters(
+            engine=args.engine, backend=args.backend, decoder=args.decoder
+        ),
+    )
 
-def main():
-    parser = argparse.ArgumentParser(description="Record a Python script execution")
-    parser.add_argument("script", help="Python script to record")
-    parser.add_argument("output", help="Output MP4 filename")
-    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the Python script")
-
-    args = parser.parse_args()
-    record_script(args.script, args.args, args.output)
 
 if __name__ == "__main__":
     main()
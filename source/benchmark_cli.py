@@ -0,0 +1,254 @@
+"""Command line benchmarks of the pitch extraction."""
+
+import argparse
+from contextlib import redirect_stdout
+from dataclasses import replace
+import os
+import time
+
+import numpy as np
+import polars as pl
+import torch
+import torchcrepe
+
+from decoded_audio import DecodedAudio, decode_audio
+from inference_backends import calibration_frames, load_backend, normalize_frames
+from model import ExtractionParameters
+from pitch_decoders import DECODERS, PitchDecoder, create_decoder
+from pitch_engines import create_engine, extract_pitch_data_frame, select_device
+
+REFERENCE = "crepe-full:torchcrepe"
+CANDIDATES = [
+    "crepe-full:torchscript",
+    "crepe-full:int8",
+    "crepe-tiny:torchcrepe",
+    "crepe-tiny:int8",
+    "yin",
+]
+
+
+def parse_variant(variant: str) -> ExtractionParameters:
+    """Parse ENGINE[:BACKEND], e.g. crepe-full:int8, into extraction parameters."""
+    engine, _, backend = variant.partition(":")
+    return replace(
+        ExtractionParameters(), engine=engine, backend=backend or "torchcrepe"
+    )
+
+
+def timed_extraction(
+    audio: DecodedAudio, parameters: ExtractionParameters
+) -> tuple[pl.DataFrame, float]:
+    """Extract the pitch data and measure the wall time it took."""
+    # Load the network outside of the timing, loading may also draw random numbers
+    if parameters.engine.startswith("crepe-"):
+        device, _ = select_device()
+        capacity = parameters.engine.removeprefix("crepe-")
+        with torch.inference_mode():
+            load_backend(parameters.backend, capacity, device)(calibration_frames(1))
+
+    # Same dither noise (drawn by scipy) in every run, so differences come
+    # from the network
+    np.random.seed(0)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        pitch_data = extract_pitch_data_frame(audio, parameters)
+    return pitch_data, time.perf_counter() - start
+
+
+def compare_pitch_data(
+    pitch_data: pl.DataFrame, reference: pl.DataFrame, confidence_threshold: float
+) -> dict[str, float]:
+    """Accuracy of pitch data against the reference, over the same frames."""
+    confidence = pitch_data["confidence"].to_numpy()
+    reference_confidence = reference["confidence"].to_numpy()
+    voiced = reference_confidence > confidence_threshold
+    cents = 1200 * np.abs(
+        np.log2(
+            pitch_data["frequency"].to_numpy()[voiced]
+            / reference["frequency"].to_numpy()[voiced]
+        )
+    )
+    if len(cents) == 0:
+        cents = np.array([np.nan])
+    return {
+        "mean_cents": float(np.mean(cents)),
+        "median_cents": float(np.median(cents)),
+        "p95_cents": float(np.percentile(cents, 95)),
+        "within_50_cents": float(np.mean(cents <= 50)),
+        "voicing_agreement": float(
+            np.mean((confidence > confidence_threshold) == voiced)
+        ),
+        "confidence_error": float(np.mean(np.abs(confidence - reference_confidence))),
+    }
+
+
+def accuracy_report(
+    wav_file: str, candidates: list[str], confidence_threshold: float = 0.5
+) -> None:
+    """Compare the speed and accuracy of extraction variants against full CREPE."""
+    audio = decode_audio(wav_file)
+    # Resample once, outside of the timings
+    samples = audio.mono_16k
+
+    reference, reference_seconds = timed_extraction(audio, parse_variant(REFERENCE))
+    voiced_frames = (reference["confidence"] > confidence_threshold).sum()
+    print(
+        f"{audio.duration:.0f} s of audio ({len(samples)} samples at 16 kHz), "
+        f"{voiced_frames} voiced reference frames "
+        f"(confidence > {confidence_threshold})"
+    )
+    print(
+        f"{'variant':<18}{'wall s':>8}{'speedup':>9}{'mean ¢':>8}{'median ¢':>10}{'p95 ¢':>8}"
+        f"{'≤50 ¢':>8}{'voicing':>9}{'conf err':>10}"
+    )
+    print(f"{REFERENCE:<18}{reference_seconds:>8.1f}{1:>8.2f}x")
+    for candidate in candidates:
+        pitch_data, seconds = timed_extraction(audio, parse_variant(candidate))
+        scores = compare_pitch_data(pitch_data, reference, confidence_threshold)
+        print(
+            f"{candidate:<18}{seconds:>8.1f}{reference_seconds / seconds:>8.2f}x"
+            f"{scores['mean_cents']:>8.1f}{scores['median_cents']:>10.1f}"
+            f"{scores['p95_cents']:>8.1f}"
+            f"{scores['within_50_cents']:>8.1%}{scores['voicing_agreement']:>9.1%}"
+            f"{scores['confidence_error']:>10.3f}"
+        )
+
+
+def network_probabilities(
+    audio: DecodedAudio, parameters: ExtractionParameters
+) -> torch.Tensor:
+    """CREPE's pitch bin probabilities of every frame, shaped (1, 360, frames)."""
+    device, batch_size = select_device()
+    infer = load_backend(
+        parameters.backend, parameters.engine.removeprefix("crepe-"), device
+    )
+    windows = create_engine(audio, parameters).frame_windows(torchcrepe.WINDOW_SIZE)
+    batches = []
+    with torch.inference_mode():
+        for start in range(0, len(windows), batch_size):
+            frames = torch.from_numpy(np.array(windows[start : start + batch_size]))
+            batches.append(infer(normalize_frames(frames.to(device))))
+    return torch.cat(batches).T[None].clone()
+
+
+def timed_decoding(
+    probabilities: torch.Tensor,
+    parameters: ExtractionParameters,
+    decoder: PitchDecoder,
+    batch_size: int,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Decode the probabilities batch by batch, with the wall time it took."""
+    np.random.seed(0)
+    pitch, periodicity = [], []
+    start = time.perf_counter()
+    for batch_start in range(0, probabilities.shape[2], batch_size):
+        batch_pitch, batch_periodicity = torchcrepe.postprocess(
+            probabilities[:, :, batch_start : batch_start + batch_size].clone(),
+            parameters.fmin,
+            parameters.fmax,
+            decoder,
+            return_periodicity=True,
+        )
+        pitch.append(batch_pitch.squeeze(0).numpy())
+        periodicity.append(batch_periodicity.squeeze(0).numpy())
+    seconds = time.perf_counter() - start
+    return np.concatenate(pitch), np.concatenate(periodicity), seconds
+
+
+def decoder_report(
+    wav_file: str, variant: str = REFERENCE, confidence_threshold: float = 0.5
+) -> None:
+    """Time the decoders on the network output and compare them to whole file Viterbi.
+
+    Decoding the whole file at once is the batch extraction ideal; the
+    interactive extraction decodes batch by batch as the network produces
+    them.
+    """
+    parameters = parse_variant(variant)
+    audio = decode_audio(wav_file)
+    probabilities = network_probabilities(audio, parameters)
+    frame_count = probabilities.shape[2]
+    _, batch_size = select_device()
+
+    # librosa compiles its Viterbi on first use
+    timed_decoding(probabilities[:, :, :2], parameters, torchcrepe.decode.viterbi, 2)
+    reference, periodicity, reference_seconds = timed_decoding(
+        probabilities, parameters, torchcrepe.decode.viterbi, frame_count
+    )
+    voiced = periodicity > confidence_threshold
+    runs = [
+        ("viterbi, whole file", torchcrepe.decode.viterbi, frame_count),
+        ("viterbi, restarting", torchcrepe.decode.viterbi, batch_size),
+        *((name, create_decoder(name), batch_size) for name in DECODERS),
+    ]
+    print(
+        f"{audio.duration:.0f} s of audio, {voiced.sum()} voiced frames, "
+        f"decoded in batches of {batch_size} frames"
+    )
+    print(f"{'decoder':<22}{'ms / audio s':>13}{'median ¢':>10}{'p95 ¢':>8}{'≤50 ¢':>8}")
+    for name, decoder, run_batch_size in runs:
+        if name == "viterbi, whole file":
+            pitch, seconds = reference, reference_seconds
+        else:
+            pitch, _, seconds = timed_decoding(
+                probabilities, parameters, decoder, run_batch_size
+            )
+        cents = 1200 * np.abs(np.log2(pitch[voiced] / reference[voiced]))
+        if len(cents) == 0:
+            cents = np.array([np.nan])
+        print(
+            f"{name:<22}{1000 * seconds / audio.duration:>13.2f}"
+            f"{np.median(cents):>10.1f}{np.percentile(cents, 95):>8.1f}"
+            f"{np.mean(cents <= 50):>8.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pitch extraction")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    accuracy = subparsers.add_parser(
+        "accuracy",
+        help=f"Compare the speed and accuracy of extraction variants to {REFERENCE}",
+    )
+    accuracy.add_argument("audio", help="Path to the .wav file")
+    accuracy.add_argument(
+        "variants",
+        nargs="*",
+        default=CANDIDATES,
+        help="Variants as ENGINE[:BACKEND] (default: %(default)s)",
+    )
+    accuracy.add_argument(
+        "--confidence-threshold",
+        type=float,
+        default=0.5,
+        help="Confidence above which a reference frame counts as voiced",
+    )
+
+    decoders = subparsers.add_parser(
+        "decoders",
+        help="Time the pitch decoders and compare them to whole file Viterbi decoding",
+    )
+    decoders.add_argument("audio", help="Path to the .wav file")
+    decoders.add_argument(
+        "variant",
+        nargs="?",
+        default=REFERENCE,
+        help="CREPE variant producing the probabilities (default: %(default)s)",
+    )
+    decoders.add_argument(
+        "--confidence-threshold",
+        type=float,
+        default=0.5,
+        help="Confidence above which a frame counts as voiced",
+    )
+
+    args = parser.parse_args()
+    if args.command == "accuracy":
+        accuracy_report(args.audio, args.variants, args.confidence_threshold)
+    elif args.command == "decoders":
+        decoder_report(args.audio, args.variant, args.confidence_threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Command line tools for the pitch data cache."""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import glob
+import multiprocessing
+import os
+from pathlib import Path
+import time
+from datetime import datetime
+
+import polars as pl
+
+from caching import (
+    cache_key,
+    evict_cache,
+    get_cache_budget,
+    get_cache_directory,
+    hash_file_cached,
+    is_cached,
+    parse_size,
+    prune_hash_index,
+    read_manifest,
+    save_pitch_to_cache,
+    save_to_cache,
+)
+from dataframe_operations import process_pitch_data
+from decoded_audio import decode_audio
+from inference_backends import BACKENDS
+from model import ExtractionParameters, Pitch, ProcessingParameters
+from pitch_decoders import DECODERS
+from pitch_engines import ENGINES, extract_pitch_data_frame
+
+
+def available_cores() -> int:
+    """Number of cores this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def find_wav_files(patterns: list[str]) -> list[Path]:
+    """Expand directories (recursively) and glob patterns into WAV files."""
+    files: dict[Path, None] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = sorted(path.rglob("*"))
+        else:
+            candidates = [Path(p) for p in sorted(glob.glob(pattern, recursive=True))]
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() == ".wav":
+                files[candidate.resolve()] = None
+    return list(files)
+
+
+def _init_worker(threads_per_worker: int) -> None:
+    """Limit the threads of each worker so that workers don't oversubscribe."""
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    torch.set_num_interop_threads(1)
+
+
+def _extract(
+    wav_file: Path,
+    extraction_parameters: ExtractionParameters,
+    processing_parameters: ProcessingParameters,
+) -> tuple[pl.DataFrame, Pitch, float]:
+    """Extract and process the pitch data of a file, with the audio duration."""
+    audio = decode_audio(wav_file)
+    # The parent reports progress, silence the per chunk messages
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        raw_pitch_data = extract_pitch_data_frame(audio, extraction_parameters)
+    pitch = process_pitch_data(
+        raw_pitch_data,
+        audio,
+        processing_parameters,
+        extraction_parameters.hop_seconds,
+    )
+    return raw_pitch_data, pitch, audio.duration
+
+
+def warm_cache(
+    patterns: list[str],
+    workers: int | None = None,
+    threads_per_worker: int = 1,
+    extraction_parameters: ExtractionParameters | None = None,
+    processing_parameters: ProcessingParameters | None = None,
+) -> None:
+    """Extract and cache the pitch data of every WAV file that is not cached yet."""
+    if extraction_parameters is None:
+        extraction_parameters = ExtractionParameters()
+    if processing_parameters is None:
+        processing_parameters = ProcessingParameters()
+    wav_files = find_wav_files(patterns)
+    if workers is None:
+        workers = max(1, available_cores() // threads_per_worker)
+
+    pending: dict[Path, str] = {}
+    for wav_file in wav_files:
+        wav_hash = hash_file_cached(wav_file)
+        if is_cached(cache_key(wav_hash, extraction_parameters, processing_parameters)):
+            print(f"Cached: {wav_file}")
+        elif wav_hash in pending.values():
+            print(f"Duplicate content: {wav_file}")
+        else:
+            pending[wav_file] = wav_hash
+    print(
+        f"{len(wav_files)} files found, {len(pending)} to extract "
+        f"with {workers} workers x {threads_per_worker} threads."
+    )
+    if not pending:
+        return
+
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _extract, wav_file, extraction_parameters, processing_parameters
+            ): wav_file
+            for wav_file in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            wav_file = futures[future]
+            try:
+                raw_pitch_data, pitch, duration = future.result()
+            except (OSError, ValueError, RuntimeError) as error:
+                # Unreadable or undecodable files, and failures of the network
+                print(f"[{done}/{len(futures)}] Failed: {wav_file}: {error}")
+                continue
+            wav_hash = pending[wav_file]
+            save_to_cache(
+                cache_key(wav_hash, extraction_parameters), raw_pitch_data, source=wav_file
+            )
+            save_pitch_to_cache(
+                cache_key(wav_hash, extraction_parameters, processing_parameters),
+                pitch,
+                source=wav_file,
+            )
+            audio_seconds += duration
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{done}/{len(futures)}] {wav_file} ({duration:.0f} s), "
+                f"{audio_seconds / elapsed:.2f} audio s / wall s"
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Extracted {audio_seconds:.0f} s of audio in {elapsed:.0f} s: "
+        f"{audio_seconds / elapsed:.2f} audio seconds per wall second."
+    )
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def show_cache_info() -> None:
+    """List the cache entries from the least to the most recently used."""
+    manifest = read_manifest()
+    entries = sorted(manifest.items(), key=lambda item: item[1]["last_access"])
+    for key, entry in entries:
+        last_access = datetime.fromtimestamp(entry["last_access"])
+        print(
+            f"{key[:12]}  {format_size(entry['size']):>10}  "
+            f"{last_access:%Y-%m-%d %H:%M}  {entry['source'] or '-'}"
+        )
+    total_size = sum(entry["size"] for entry in manifest.values())
+    print(
+        f"{len(manifest)} entries, {format_size(total_size)} of "
+        f"{format_size(get_cache_budget())} in {get_cache_directory()}"
+    )
+
+
+def prune_cache(budget: int | None = None) -> None:
+    """Evict least recently used entries down to the budget and drop stale hashes."""
+    if budget is None:
+        budget = get_cache_budget()
+    evicted = evict_cache(budget)
+    stale_hashes = prune_hash_index()
+    print(
+        f"Removed {len(evicted)} entries to fit {format_size(budget)}, "
+        f"forgot {stale_hashes} missing files."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the pitch data cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm = subparsers.add_parser(
+        "warm", help="Extract and cache the pitch data of WAV files"
+    )
+    warm.add_argument("paths", nargs="+", help="Directories or glob patterns of WAV files")
+    warm.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (default: cores / threads)"
+    )
+    warm.add_argument(
+        "--threads-per-worker", type=int, default=1, help="Torch threads per worker"
+    )
+    warm.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=ExtractionParameters.engine,
+        help="Pitch engine to extract with",
+    )
+    warm.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="torchcrepe",
+        help="Inference backend of the pitch extraction",
+    )
+    warm.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default="viterbi",
+        help="Decoder of the CREPE pitch probabilities",
+    )
+
+    subparsers.add_parser("info", help="List the cache entries and the cache size")
+
+    prune = subparsers.add_parser(
+        "prune", help="Evict the least recently used entries down to a size budget"
+    )
+    prune.add_argument(
+        "--budget",
+        type=parse_size,
+        default=None,
+        help="Size to prune to, e.g. 500M (default: the configured budget, 0 empties it)",
+    )
+
+    args = parser.parse_args()
+    if args.command == "warm":
+        warm_cache(
+            args.paths,
+            args.workers,
+            args.threads_per_worker,
+            ExtractionParameters(
+                engine=args.engine, backend=args.backend, decoder=args.decoder
+            ),
+        )
+    elif args.command == "info":
+        show_cache_info()
+    elif args.command == "prune":
+        prune_cache(args.budget)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,37 @@
 """Caching module."""
 
+from collections.abc import Iterator
+from contextlib import contextmanager
+import copy
+from dataclasses import asdict
 from pathlib import Path
 import hashlib
+import json
 import os
 import sys
+import tempfile
+import time
 
 import polars as pl
 
+from model import Pitch
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
 APP_NAME = "microtonal_view"
+HASH_INDEX_FILE = "hash_index.json"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "cache.lock"
+# Lookups refresh the last access of an entry at most this often, in seconds,
+# so that reading the cache rarely writes the manifest
+ACCESS_TIME_RESOLUTION = 60.0
+CACHE_BUDGET_ENV = "MICROTONAL_VIEW_CACHE_BUDGET"
+DEFAULT_CACHE_BUDGET = 2 * 1024**3  # bytes
+# Bump when the cached data changes for the same parameters
+CACHE_SCHEMA_VERSION = 3
 
 
 def get_cache_directory() -> Path:
@@ -29,24 +53,289 @@ def get_cache_directory() -> Path:
 
 def hash_file(file_path: Path) -> str:
     """Generate a SHA-256 hash of the file."""
-    sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for block in iter(lambda: f.read(4096), b""):
-            sha256.update(block)
-    return sha256.hexdigest()
+        # Reads into a large reusable buffer and hashes without holding the GIL
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def read_json(json_path: Path) -> dict:
+    """Read a JSON object, an unreadable or missing file is empty."""
+    try:
+        with open(json_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_json(json_path: Path, data: dict) -> None:
+    """Write a JSON object atomically so concurrent readers never see half a file."""
+    with tempfile.NamedTemporaryFile(
+        "w", dir=json_path.parent, suffix=".tmp", delete=False
+    ) as f:
+        json.dump(data, f)
+    os.replace(f.name, json_path)
+
+
+@contextmanager
+def cache_lock() -> Iterator[None]:
+    """Hold the lock of the cache directory, shared by all processes.
+
+    Updates of the manifest and the hash index hold it, so that processes
+    writing the cache at the same time don't lose each other's entries.
+    Not reentrant, callers hold it once around a whole update.
+    """
+    with open(get_cache_directory() / LOCK_FILE, "a+b") as lock_file:
+        if sys.platform == "win32":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def hash_file_cached(file_path: Path | str) -> str:
+    """Hash the file, reusing the recorded hash while the file is unchanged.
+
+    The cache index maps the absolute path to the file's size, modification
+    time and inode, so repeated opens of the same file skip the full hash.
+    """
+    file_path = Path(file_path).resolve()
+    stat = file_path.stat()
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+    index_path = get_cache_directory() / HASH_INDEX_FILE
+    index = read_json(index_path)
+    entry = index.get(str(file_path))
+    if entry is not None and entry["signature"] == signature:
+        return entry["hash"]
+
+    file_hash = hash_file(file_path)
+    with cache_lock():
+        index = read_json(index_path)  # Re-read, hashing can take a while
+        index[str(file_path)] = {"signature": signature, "hash": file_hash}
+        write_json(index_path, index)
+    return file_hash
+
+
+def parse_size(size: str) -> int:
+    """Parse a byte size such as 500M or 2G."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().removesuffix("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def get_cache_budget() -> int:
+    """Get the cache size limit in bytes, configurable with an environment variable."""
+    budget = os.environ.get(CACHE_BUDGET_ENV)
+    if budget:
+        return parse_size(budget)
+    return DEFAULT_CACHE_BUDGET
+
+
+def adopt_cached_files(cache_dir: Path) -> dict[str, dict]:
+    """Manifest entries of the Parquet files cached without a manifest.
+
+    The files of one key, the data and the regions of a processed pitch,
+    become one entry with the data file first.
+    """
+    files: dict[str, list[Path]] = {}
+    for cache_file_path in sorted(cache_dir.glob("*.parquet")):
+        files.setdefault(cache_file_path.name.split(".")[0], []).append(cache_file_path)
+
+    manifest = {}
+    for key, paths in files.items():
+        paths.sort(key=lambda path: path.name != f"{key}.parquet")
+        stats = [path.stat() for path in paths]
+        manifest[key] = {
+            "files": [path.name for path in paths],
+            "size": sum(stat.st_size for stat in stats),
+            "last_access": max(stat.st_mtime for stat in stats),
+            "source": None,
+        }
+    return manifest
+
+
+@contextmanager
+def update_manifest() -> Iterator[dict[str, dict]]:
+    """Lock the cache and yield the manifest, which is written back if changed.
+
+    Each entry records the cache files, their total size in bytes, the
+    last access time and the source file the entry was computed from.
+    Without a manifest, the files already in the cache are adopted into one.
+    """
+    cache_dir = get_cache_directory()
+    manifest_path = cache_dir / MANIFEST_FILE
+    with cache_lock():
+        if manifest_path.exists():
+            original = read_json(manifest_path)
+            manifest = copy.deepcopy(original)
+        else:
+            original = None
+            manifest = adopt_cached_files(cache_dir)
+        yield manifest
+        if manifest != original:
+            write_json(manifest_path, manifest)
 
 
-def save_to_cache(wav_hash: str, pitch_data: pl.DataFrame):
+def read_manifest() -> dict[str, dict]:
+    """Read the manifest of cache entries, see update_manifest."""
+    with update_manifest() as manifest:
+        return copy.deepcopy(manifest)
+
+
+def remove_cache_entry(manifest: dict[str, dict], key: str) -> None:
+    """Delete the files of a cache entry and drop it from the manifest."""
+    cache_dir = get_cache_directory()
+    for file_name in manifest.pop(key)["files"]:
+        (cache_dir / file_name).unlink(missing_ok=True)
+
+
+def evict_entries(
+    manifest: dict[str, dict], budget: int, keep: str | None = None
+) -> list[str]:
+    """Remove the least recently used entries of the manifest until it fits the budget."""
+    total_size = sum(entry["size"] for entry in manifest.values())
+    evicted = []
+    for key in sorted(manifest, key=lambda key: manifest[key]["last_access"]):
+        if total_size <= budget:
+            break
+        if key == keep:
+            continue
+        total_size -= manifest[key]["size"]
+        remove_cache_entry(manifest, key)
+        evicted.append(key)
+    return evicted
+
+
+def evict_cache(budget: int, keep: str | None = None) -> list[str]:
+    """Remove the least recently used entries until the cache fits the budget."""
+    with update_manifest() as manifest:
+        return evict_entries(manifest, budget, keep)
+
+
+def prune_hash_index() -> int:
+    """Drop hash index entries of files that no longer exist."""
+    index_path = get_cache_directory() / HASH_INDEX_FILE
+    with cache_lock():
+        index = read_json(index_path)
+        missing = [path for path in index if not Path(path).exists()]
+        for path in missing:
+            del index[path]
+        if missing:
+            write_json(index_path, index)
+    return len(missing)
+
+
+def cache_key(wav_hash: str, *parameters) -> str:
+    """Key of the data computed from the audio with the given parameter dataclasses."""
+    description = json.dumps(
+        [CACHE_SCHEMA_VERSION, wav_hash, *(asdict(p) for p in parameters)],
+        sort_keys=True,
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def add_cache_entry(
+    key: str, files: list[Path], source: Path | str | None = None, **metadata
+) -> None:
+    """Record the files of a new cache entry in the manifest and enforce the budget."""
+    entry = {
+        "files": [file_path.name for file_path in files],
+        "size": sum(file_path.stat().st_size for file_path in files),
+        "last_access": time.time(),
+        "source": None if source is None else str(Path(source).resolve()),
+        **metadata,
+    }
+    with update_manifest() as manifest:
+        manifest[key] = entry
+        evict_entries(manifest, get_cache_budget(), keep=key)
+
+
+def access_cache_entry(key: str) -> dict | None:
+    """Look up a cache entry and mark it as used, None if it is missing."""
+    cache_dir = get_cache_directory()
+    with update_manifest() as manifest:
+        entry = manifest.get(key)
+        if entry is None:
+            return None
+        if not all((cache_dir / file_name).exists() for file_name in entry["files"]):
+            # Deleted behind the manifest's back
+            remove_cache_entry(manifest, key)
+            return None
+
+        now = time.time()
+        if now - entry["last_access"] >= ACCESS_TIME_RESOLUTION:
+            entry["last_access"] = now
+        return copy.deepcopy(entry)
+
+
+def save_to_cache(
+    key: str, pitch_data: pl.DataFrame, source: Path | str | None = None
+):
     """Save the Polars DataFrame to a cache file in the system's cache directory."""
     cache_dir = get_cache_directory()
-    cache_file_path = cache_dir / f"{wav_hash}.parquet"
+    cache_file_path = cache_dir / f"{key}.parquet"
     pitch_data.write_parquet(cache_file_path)
+    add_cache_entry(key, [cache_file_path], source)
+
 
+def is_cached(key: str) -> bool:
+    """Check whether data for the key is in the cache."""
+    return key in read_manifest()
 
-def load_from_cache(wav_hash: str) -> pl.DataFrame | None:
+
+def load_from_cache(key: str) -> pl.DataFrame | None:
     """Load the Polars DataFrame from a cache file if it exists."""
+    entry = access_cache_entry(key)
+    if entry is None:
+        return None
+    return pl.read_parquet(get_cache_directory() / entry["files"][0])
+
+
+def save_pitch_to_cache(key: str, pitch: Pitch, source: Path | str | None = None):
+    """Save the processed pitch data, its regions and statistics to the cache."""
+    cache_dir = get_cache_directory()
+    data_path = cache_dir / f"{key}.parquet"
+    regions_path = cache_dir / f"{key}.regions.parquet"
+    pitch.annotated_pitch_data_frame.write_parquet(data_path)
+    pitch.top_k_freq_bins.write_parquet(regions_path)
+    stats = {
+        "min_frequency": float(pitch.min_frequency),
+        "max_frequency": float(pitch.max_frequency),
+        "min_loudness": float(pitch.min_loudness),
+        "max_loudness": float(pitch.max_loudness),
+    }
+    add_cache_entry(key, [data_path, regions_path], source, stats=stats)
+
+
+def load_pitch_from_cache(key: str) -> Pitch | None:
+    """Load the processed pitch data from the cache if it exists."""
+    entry = access_cache_entry(key)
+    if entry is None or len(entry["files"]) != 2:
+        return None
     cache_dir = get_cache_directory()
-    cache_file_path = cache_dir / f"{wav_hash}.parquet"
-    if cache_file_path.exists():
-        return pl.read_parquet(cache_file_path)
-    return None
+    data_file, regions_file = entry["files"]
+    data = pl.read_parquet(cache_dir / data_file)
+    stats = entry.get("stats")
+    if stats is None:
+        # Adopted without a manifest, which is where the statistics are kept
+        stats = {
+            "min_frequency": data["frequency"].min(),
+            "max_frequency": data["frequency"].max(),
+            "min_loudness": data["loudness"].min(),
+            "max_loudness": data["loudness"].max(),
+        }
+    return Pitch(
+        annotated_pitch_data_frame=data,
+        top_k_freq_bins=pl.read_parquet(cache_dir / regions_file),
+        **stats,
+    )
@@ -1,69 +1,162 @@
 """Playing the audio files."""
 
+import sys
+import threading
 import time
-import simpleaudio
+
+import pygame
+from pygame._sdl2 import audio as sdl_audio, sdl2
+
+from decoded_audio import DecodedAudio
+
+# SDL sample formats of the native endian PCM sample widths decode_audio produces
+_SAMPLE_FORMATS = (
+    {2: sdl_audio.AUDIO_S16LSB, 4: sdl_audio.AUDIO_S32LSB}
+    if sys.byteorder == "little"
+    else {2: sdl_audio.AUDIO_S16MSB, 4: sdl_audio.AUDIO_S32MSB}
+)
+
 
 class AudioPlayer:
-    def __init__(self, audio_segment):
-        self.audio_segment = audio_segment
-        self.play_obj = None
-        self.start_time = None  # System time when playback started
-        self.current_time = 0   # Current playback position in seconds
+    """Plays decoded audio and keeps the playback clock.
+
+    SDL pulls the samples in a callback straight from the one PCM buffer of
+    the file, so starting or seeking only moves an offset, anywhere in a file
+    of any length.
+
+    The clock counts the frames handed to the output, less the output buffer
+    still playing ahead of them, and interpolates with the monotonic clock
+    between callbacks. It follows the sound card rather than the wall clock,
+    never runs backwards while playing and stops on the exact frame when
+    paused. `av_offset_ms` shifts the time shown by the visuals relative to
+    the audio, to compensate for the display and the audio output latency.
+    """
+
+    def __init__(
+        self, audio: DecodedAudio, av_offset_ms: float = 0.0, buffer_frames: int = 1024
+    ):
+        self.audio = audio
+        self.pcm_bytes = audio.pcm_bytes
+        self.frame_bytes = audio.channels * audio.sample_width
+        self.frame_count = len(audio.pcm)
+        self.av_offset_ms = av_offset_ms
+        self.buffer_frames = buffer_frames
+        self.device: sdl_audio.AudioDevice | None = None
         self.is_playing_flag = False
+        self._lock = threading.Lock()
+        self._start_frame = 0  # Frame playback was started or seeked from
+        self._next_frame = 0  # Next frame handed to the output
+        self._clock_frame = 0.0  # Frame heard at _clock_time
+        self._clock_time = time.perf_counter()
+        self._last_time = 0.0  # Latest time returned while playing
+
+    @property
+    def output_latency_ms(self) -> float:
+        """Time from a frame handed to the output to the frame being heard."""
+        return 1000 * self.buffer_frames / self.audio.sample_rate
+
+    def _open(self) -> sdl_audio.AudioDevice:
+        if self.device is None:
+            # The mixer isn't used, and some drivers only open one device
+            if pygame.mixer.get_init():
+                pygame.mixer.quit()
+            sdl2.init_subsystem(sdl2.INIT_AUDIO)
+            self.device = sdl_audio.AudioDevice(
+                devicename=None,
+                iscapture=False,
+                frequency=self.audio.sample_rate,
+                audioformat=_SAMPLE_FORMATS[self.audio.sample_width],
+                numchannels=self.audio.channels,
+                chunksize=self.buffer_frames,
+                allowed_changes=0,
+                callback=self._fill,
+            )
+        return self.device
+
+    def _fill(self, device: sdl_audio.AudioDevice, buffer: memoryview) -> None:
+        """SDL callback copying the next frames of the file into the output."""
+        with self._lock:
+            start = self._next_frame * self.frame_bytes
+            count = max(0, min(len(buffer), len(self.pcm_bytes) - start))
+            buffer[:count] = self.pcm_bytes[start : start + count]
+            if count < len(buffer):
+                buffer[count:] = bytes(len(buffer) - count)
+            if count == 0:
+                # Past the end the clock runs on to the last frame and stays
+                return
+            # The buffer handed out last time starts playing now
+            self._clock_frame = max(
+                self._start_frame, self._next_frame - len(buffer) / self.frame_bytes
+            )
+            self._clock_time = time.perf_counter()
+            self._next_frame += count // self.frame_bytes
+
+    def _set_position(self, start_time: float) -> None:
+        frame = min(max(0, round(start_time * self.audio.sample_rate)), self.frame_count)
+        self._start_frame = frame
+        self._next_frame = frame
+        self._clock_frame = float(frame)
+        self._clock_time = time.perf_counter()
+        self._last_time = 0.0
 
     def play(self, start_time=0):
-        self.stop()  # Stop any existing playback
-        self.current_time = start_time
-        self.start_time = time.time() - start_time
-        self.is_playing_flag = True
-
-        # Slice the audio segment from the start_time
-        segment_to_play = self.audio_segment[start_time * 1000:]
-
-        # Extract raw data
-        raw_data = segment_to_play.raw_data
-
-        # Get audio parameters
-        num_channels = segment_to_play.channels
-        bytes_per_sample = segment_to_play.sample_width
-        sample_rate = segment_to_play.frame_rate
-
-        # Play the raw data using simpleaudio
-        self.play_obj = simpleaudio.play_buffer(
-            raw_data,
-            num_channels,
-            bytes_per_sample,
-            sample_rate
-        )
+        with self._lock:
+            self._set_position(start_time)
+            self.is_playing_flag = True
+        self._open().pause(0)
 
     def stop(self):
-        if self.play_obj is not None:
-            self.play_obj.stop()
-            self.play_obj = None
+        if self.device is not None:
+            self.device.pause(1)
         self.is_playing_flag = False
-        self.start_time = None
 
     def pause(self):
-        if self.play_obj is not None:
-            self.current_time = self.get_elapsed_time()
-            self.play_obj.stop()
-            self.play_obj = None
+        if self.device is not None:
+            self.device.pause(1)
+        with self._lock:
+            # Resume from the frame heard last, not from the buffered ones
+            self._set_position(self._elapsed_time())
             self.is_playing_flag = False
-            self.start_time = None
 
     def seek(self, time_sec):
         """Seek to a specific time in seconds without starting playback."""
-        self.current_time = time_sec
+        with self._lock:
+            self._set_position(time_sec)
+
+    def close(self):
+        """Stop playback and release the audio device."""
+        self.stop()
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def _elapsed_time(self) -> float:
+        frame = self._clock_frame
         if self.is_playing_flag:
-            self.play(start_time=time_sec)
+            frame += (time.perf_counter() - self._clock_time) * self.audio.sample_rate
+            # Never ahead of the frames the output has been given
+            frame = min(frame, self._next_frame)
+        return frame / self.audio.sample_rate
 
     def get_elapsed_time(self):
-        if self.is_playing_flag and self.start_time is not None:
-            return time.time() - self.start_time
-        else:
-            return self.current_time
-
-    def is_playing(self):
-        if self.play_obj is not None:
-            return self.play_obj.is_playing()
-        return False
+        """The playback position in seconds of the audio being heard."""
+        with self._lock:
+            elapsed = self._elapsed_time()
+            if self.is_playing_flag:
+                # A callback may land slightly behind the interpolation
+                elapsed = max(elapsed, self._last_time)
+                self._last_time = elapsed
+            return elapsed
+
+    def is_playing(self) -> bool:
+        """Whether the audio is being heard, up to the end of its last buffer."""
+        with self._lock:
+            return self.is_playing_flag and self._elapsed_time() < self.audio.duration
+
+    def finished(self) -> bool:
+        """Whether playback reached the end of the file.
+
+        The clock then stays at the end, until a seek moves it back.
+        """
+        with self._lock:
+            return self.is_playing_flag and self._elapsed_time() >= self.audio.duration
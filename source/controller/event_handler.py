@@ -1,11 +1,18 @@
 """Manager event handling."""
 
+from collections.abc import Callable
+
 import pygame
 import pygame_gui
 
 from controller.audio_player import AudioPlayer
 from controller.program_state import ProgramState
 
+# Factor of one zoom step, two steps double or halve the seconds on screen
+ZOOM_STEP = 2**0.5
+ZOOM_IN_KEYS = (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS)
+ZOOM_OUT_KEYS = (pygame.K_MINUS, pygame.K_KP_MINUS)
+
 
 def handle_visualiser_events(
     ui_manager: pygame_gui.UIManager,
@@ -16,8 +23,12 @@ def handle_visualiser_events(
     music_length: float,
     play_pause_button: pygame_gui.elements.UIButton,
     program_state: ProgramState,
+    zoom: Callable[[float], None] | None = None,
 ) -> ProgramState:
-    """Event controller loop. Returns the updated ProgramState."""
+    """Event controller loop. Returns the updated ProgramState.
+
+    The mouse wheel and the +/- keys call `zoom` with the factor to zoom in by.
+    """
     for event in pygame.event.get():
         ui_manager.process_events(event)
         if event.type == pygame.QUIT:
@@ -45,6 +56,9 @@ def handle_visualiser_events(
             slider.set_current_value(new_value)
             player.seek(current_time)  # Update player's position regardless of play state
 
+        elif event.type == pygame.MOUSEWHEEL and zoom is not None:
+            zoom(ZOOM_STEP**event.y)
+
         elif event.type == pygame.KEYDOWN:
             SLIDER_STEP = 1
             if event.key == pygame.K_LEFT:
@@ -66,6 +80,10 @@ def handle_visualiser_events(
                     return ProgramState.PAUSED
                 elif program_state == ProgramState.PAUSED:
                     return ProgramState.PLAYING
+            elif zoom is not None and event.key in ZOOM_IN_KEYS:
+                zoom(ZOOM_STEP)
+            elif zoom is not None and event.key in ZOOM_OUT_KEYS:
+                zoom(1 / ZOOM_STEP)
             else:
                 continue
         else:
@@ -74,12 +92,14 @@ def handle_visualiser_events(
     return program_state
 
 
-def handle_header_events(
+def handle_loading_events(
     ui_manager: pygame_gui.UIManager,
     close_button: pygame_gui.elements.UIButton,
-    minimize_button: pygame_gui.elements.UIButton
-) -> None:
-    """Event handler for the header buttons."""
+    minimize_button: pygame_gui.elements.UIButton,
+    cancel_button: pygame_gui.elements.UIButton | None,
+) -> bool:
+    """Event handler of the loading screen. Returns whether to cancel loading."""
+    cancel = False
     for event in pygame.event.get():
         ui_manager.process_events(event)
         if event.type == pygame.QUIT:
@@ -89,7 +109,8 @@ def handle_header_events(
                 pygame.quit()
             elif event.ui_element == minimize_button:
                 pygame.display.iconify()
-            else:
-                continue
-        else:
-            continue
+            elif event.ui_element == cancel_button:
+                cancel = True
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            cancel = True
+    return cancel
@@ -0,0 +1,122 @@
+"""Pacing of the player loop to a target frame rate."""
+
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+import time
+
+import pygame
+
+
+class FrameScheduler:
+    """Paces frames to a target rate and adapts the drawing to the frame budget.
+
+    The work of each frame is timed per stage. When the recent frames take
+    longer than the budget of one frame, the drawing is simplified first
+    (`point_stride` draws every other point), then only every other frame
+    is drawn. Once frames fit comfortably again, the detail comes back. The
+    scheduler only decides how much to draw, the audio clock stays the time
+    of every frame, so a slow machine shows fewer frames of the right time.
+
+    Frames where nothing changed are marked idle and not drawn at all; the
+    loop can then block in `wait_for_event` instead of spinning.
+    """
+
+    # Smoothing of the frame work time, about the last ten frames
+    smoothing = 0.1
+    # Fractions of the budget above which to degrade and below which to recover
+    degrade_above = 1.0
+    recover_below = 0.6
+    max_level = 2
+    # Longest wait for an event of an idle loop, which still polls background work
+    idle_timeout = 0.25
+
+    def __init__(self, fps: int = 60):
+        self.fps = fps
+        self.budget = 1.0 / fps
+        self.clock = pygame.time.Clock()
+        self.level = 0
+        self.frame_count = 0
+        self.drawn_frames = 0
+        self.simplified_frames = 0
+        self.idle_frames = 0
+        self.work_seconds = 0.0
+        self.stage_totals: dict[str, float] = defaultdict(float)
+        self._frame_start = time.perf_counter()
+        self._first_frame_time = self._frame_start
+        self._draw_this_frame = True
+        self._idle = False
+
+    @property
+    def point_stride(self) -> int:
+        """Every how many points to draw, 2 while the drawing is simplified."""
+        return 2 if self.level >= 1 else 1
+
+    def begin_frame(self) -> float:
+        """Wait for the next frame, returns the seconds since the previous one."""
+        time_delta = self.clock.tick(self.fps) / 1000.0
+        self._frame_start = time.perf_counter()
+        # At the lowest level, only every other frame is drawn
+        self._draw_this_frame = self.level < 2 or self.frame_count % 2 == 0
+        self._idle = False
+        return time_delta
+
+    def should_draw(self) -> bool:
+        return self._draw_this_frame
+
+    def mark_idle(self) -> None:
+        """Nothing changed since the last drawn frame, so this one isn't drawn."""
+        self._idle = True
+        self._draw_this_frame = False
+
+    def wait_for_event(self) -> None:
+        """Block until an event arrives, or for at most `idle_timeout` seconds."""
+        event = pygame.event.wait(round(1000 * self.idle_timeout))
+        if event.type != pygame.NOEVENT:
+            # Left for the event handler of the next frame
+            pygame.event.post(event)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time one stage of the frame."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_totals[name] += time.perf_counter() - start
+
+    def end_frame(self) -> None:
+        """Account the frame and adapt the level of detail to its cost."""
+        work = time.perf_counter() - self._frame_start
+        self.frame_count += 1
+        if self._idle:
+            self.idle_frames += 1
+            return
+        if self._draw_this_frame:
+            self.drawn_frames += 1
+            if self.level >= 1:
+                self.simplified_frames += 1
+            # Frames that skipped drawing would make the work look cheaper
+            self.work_seconds += self.smoothing * (work - self.work_seconds)
+
+        if self.work_seconds > self.degrade_above * self.budget:
+            if self.level < self.max_level:
+                self.level += 1
+                self.work_seconds = self.budget * (self.degrade_above + self.recover_below) / 2
+        elif self.work_seconds < self.recover_below * self.budget and self.level > 0:
+            self.level -= 1
+            self.work_seconds = self.budget * (self.degrade_above + self.recover_below) / 2
+
+    def report(self) -> str:
+        """The achieved frame rate and the average cost of every stage."""
+        elapsed = max(time.perf_counter() - self._first_frame_time, 1e-9)
+        stages = ", ".join(
+            f"{name} {1000 * total / max(self.frame_count, 1):.1f} ms"
+            for name, total in self.stage_totals.items()
+        )
+        return (
+            f"{self.drawn_frames / elapsed:.1f} of {self.fps} fps drawn "
+            f"({self.simplified_frames} simplified, "
+            f"{self.frame_count - self.drawn_frames - self.idle_frames} skipped, "
+            f"{self.idle_frames} idle), per frame: {stages}"
+        )
@@ -0,0 +1,154 @@
+"""Progressive pitch extraction running behind the player."""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import time
+
+import numpy as np
+import polars as pl
+
+from caching import save_pitch_to_cache
+from dataframe_operations import annotate_pitch_data_frame, build_pitch
+from decoded_audio import DecodedAudio
+from extraction_worker import ExtractionWorker
+from model import (
+    ExtractionParameters,
+    ExtractionProgress,
+    Pitch,
+    ProcessingParameters,
+)
+
+
+class PitchStream:
+    """Extracts pitch data in a worker process, publishing a Pitch per chunk.
+
+    Every published Pitch covers the audio extracted so far, so the player can
+    start after the first chunk and swap in the newer snapshots as they come.
+    A background thread turns the worker's progress into Pitch snapshots and
+    caches the processed data once the whole file is extracted, the worker
+    caches the raw data. The worker starts once the loudness is computed,
+    it then shares the 16 kHz samples the loudness was computed from. With
+    the parameters of a faster preview engine, a Pitch covering the whole
+    file is published as soon as the preview is extracted, and extracted
+    frames replace the preview ones as they come.
+
+    Every snapshot is processed from scratch, so after the first one they're
+    throttled: the wait for the next one is at least ten times the time the
+    last one took. Rebuilding then costs a bounded share of the extraction
+    however long the file is.
+    """
+
+    min_snapshot_interval = 1.0
+    # Longest share of the stream's time spent building snapshots
+    snapshot_overhead = 0.1
+
+    def __init__(
+        self,
+        audio: DecodedAudio,
+        loudness: Future[np.ndarray],
+        raw_cache_key: str,
+        pitch_cache_key: str,
+        extraction_parameters: ExtractionParameters,
+        processing_parameters: ProcessingParameters,
+        preview_parameters: ExtractionParameters | None = None,
+        preview_cache_key: str | None = None,
+    ):
+        self.audio = audio
+        self.loudness = loudness
+        self.pitch_cache_key = pitch_cache_key
+        self.extraction_parameters = extraction_parameters
+        self.processing_parameters = processing_parameters
+        self.done = False
+        # The latest progress of the preview or main extraction
+        self.progress: ExtractionProgress | None = None
+        self._snapshots: queue.Queue[Pitch | None] = queue.Queue()
+        self._next_snapshot = 0.0
+        self.worker = ExtractionWorker(
+            audio.path,
+            extraction_parameters,
+            raw_cache_key,
+            preview_parameters,
+            preview_cache_key,
+        )
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pitch-stream")
+        # Holds the error of the stream, raised by poll
+        self._task = executor.submit(self._run)
+        executor.shutdown(wait=False)
+
+    def _run(self) -> None:
+        try:
+            loudness = self.loudness.result()
+            self.worker.start(self.audio.mono_16k, loudness)
+            snapshot_end = None
+            # The Pitch of the latest extracted frames, cached once it's final
+            pitch = None
+            # Whether frames were extracted since the last snapshot
+            stale = False
+            for message in self.worker.messages():
+                kind = message[0]
+                if kind == "preview":
+                    snapshot_end = self.worker.frame_count
+                    self._publish(self.worker.data_frame(snapshot_end), loudness)
+                elif kind == "preview_progress":
+                    self.progress = message[1]
+                elif kind == "progress":
+                    _, self.progress, _, end = message
+                    stale = True
+                    if time.perf_counter() >= self._next_snapshot:
+                        pitch = self._publish(
+                            self.worker.data_frame(snapshot_end or end), loudness
+                        )
+                        stale = False
+                elif kind == "done":
+                    if stale:
+                        pitch = self._publish(
+                            self.worker.data_frame(self.worker.frame_count), loudness
+                        )
+                    if pitch is not None:
+                        save_pitch_to_cache(
+                            self.pitch_cache_key, pitch, source=self.audio.path
+                        )
+        finally:
+            self.worker.close()
+            self._snapshots.put(None)
+
+    def _publish(self, raw_pitch_data: pl.DataFrame, loudness: np.ndarray) -> Pitch | None:
+        """Process raw pitch data and publish it, unless it has no pitch range."""
+        start = time.perf_counter()
+        processed_pitch_data = annotate_pitch_data_frame(
+            raw_pitch_data,
+            loudness,
+            self.processing_parameters,
+            self.extraction_parameters.hop_seconds,
+        )
+        if processed_pitch_data["frequency"].n_unique() <= 1:
+            return None
+        pitch = build_pitch(processed_pitch_data, self.processing_parameters)
+        self._snapshots.put(pitch)
+        elapsed = time.perf_counter() - start
+        self._next_snapshot = time.perf_counter() + max(
+            self.min_snapshot_interval, elapsed / self.snapshot_overhead
+        )
+        return pitch
+
+    def cancel(self) -> None:
+        """Stop the extraction after its current batch, without caching it.
+
+        The stream is done once the worker stopped.
+        """
+        self.worker.cancel()
+
+    def poll(self) -> Pitch | None:
+        """Return the newest Pitch published since the last call, if any."""
+        latest = None
+        while True:
+            try:
+                snapshot = self._snapshots.get_nowait()
+            except queue.Empty:
+                break
+            if snapshot is None:
+                self.done = True
+                self._task.result()
+                break
+            latest = snapshot
+        return latest
@@ -1,27 +1,51 @@
 """Manages the switching of scenes."""
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
 from pathlib import Path
+from typing import TypeVar
+import numpy as np
 import polars as pl
 import pygame
 import pygame_gui
-from pydub import AudioSegment
 
-from audio_features import extract_pitch_data_frame
-from caching import hash_file, load_from_cache, save_to_cache
-from controller.event_handler import handle_header_events, handle_visualiser_events
+from audio_features import calculate_loudness
+from caching import (
+    cache_key,
+    hash_file_cached,
+    load_from_cache,
+    load_pitch_from_cache,
+    save_pitch_to_cache,
+)
+from controller.frame_scheduler import FrameScheduler
+from controller.event_handler import handle_loading_events, handle_visualiser_events
+from controller.pitch_stream import PitchStream
 from controller.program_state import ProgramState
-from dataframe_operations import (
-    process_pitch_data,
-    compute_x_positions_lazy,
-    compute_y_positions_lazy,
-    filter_data_by_time_window_lazy,
+from dataframe_operations import annotate_pitch_data_frame, build_pitch
+from decoded_audio import DecodedAudio, decode_audio
+from model import (
+    ExtractionParameters,
+    ExtractionProgress,
+    Pitch,
+    ProcessingParameters,
 )
-from model import Pitch
+from pitch_engines import preview_parameters
 from view.player import PlayerView
 from view.loading_screen import loading_screen
 from controller.audio_player import AudioPlayer
 
+T = TypeVar("T")
+
+# Debug details, shown with --verbose
+logger = logging.getLogger("microtonal_view")
+
+# How long after an event the UI keeps being drawn, for hover and press states
+UI_SETTLE_MS = 500
+
+
+class LoadingCancelled(Exception):
+    """Raised when the user cancels the loading screen."""
+
 
 class HeaderWidgets:
     width: float
@@ -53,6 +77,13 @@ class SceneManager:
     height: float
     ui_manager: pygame_gui.UIManager
     header_widgets: HeaderWidgets
+    extraction_parameters: ExtractionParameters
+    processing_parameters: ProcessingParameters
+    preview_engine: str | None
+    av_offset_ms: float
+    fps: int
+    visible_seconds: float
+    loading_clock: pygame.time.Clock
 
     def __init__(
         self,
@@ -60,6 +91,12 @@ class SceneManager:
         width: float,
         height: float,
         ui_manager: pygame_gui.UIManager,
+        extraction_parameters: ExtractionParameters | None = None,
+        processing_parameters: ProcessingParameters | None = None,
+        preview_engine: str | None = None,
+        av_offset_ms: float = 0.0,
+        fps: int = 60,
+        visible_seconds: float = 5.0,
     ):
         """Initialize the scene manager and load header widgets."""
         self.screen = screen
@@ -67,6 +104,13 @@ class SceneManager:
         self.height = height
         self.ui_manager = ui_manager
         self.header_widgets = HeaderWidgets(width, ui_manager)
+        self.extraction_parameters = extraction_parameters or ExtractionParameters()
+        self.processing_parameters = processing_parameters or ProcessingParameters()
+        self.preview_engine = preview_engine
+        self.av_offset_ms = av_offset_ms
+        self.fps = fps
+        self.visible_seconds = visible_seconds
+        self.loading_clock = pygame.time.Clock()
 
     def display_menu(self) -> str | None:
         """Display the main menu and return the selected audio file path."""
@@ -119,71 +163,169 @@ class SceneManager:
 
         return selected_file
 
-    def display_loading_screen(self, audio_file: str) -> Pitch:
-        """Display the loading screen and process the pitch data."""
+    def display_loading_screen(
+        self, audio_file: str
+    ) -> tuple[DecodedAudio, Pitch, PitchStream | None] | None:
+        """Display the loading screen, decode the audio and process its pitch data.
+
+        The audio is decoded on an executor alongside its hash, and the cache
+        lookups run on it after the hash. On a miss of the
+        Pitch, loudness starts right away and runs alongside the raw cache
+        lookup. A cached Pitch is used as is and cached raw data is processed
+        in full. Otherwise extraction runs in a PitchStream worker process,
+        which also extracts the preview, and the stream is returned as soon
+        as its first Pitch is ready. Returns None when loading is cancelled.
+        """
+        hop_seconds = self.extraction_parameters.hop_seconds
         with loading_screen(
-            self.screen, int(self.width), int(self.height), Path("assets") / "microtonal-view.png"
-        ) as loader:
-            audio_hash: str = hash_file(audio_file)
-            cached_data: pl.DataFrame | None = load_from_cache(audio_hash)
-
-            with ThreadPoolExecutor(max_workers=2) as executor:
-                if cached_data is not None:
-                    raw_pitch_data = cached_data
-                    print("Using cached data...")
-                else:
-                    future = executor.submit(extract_pitch_data_frame, audio_file)
-                    print("Extracting pitch data...")
-
-                    # Frame loop: extract pitch data
-                    while not future.done():
-                        handle_header_events(
-                            self.ui_manager,
-                            self.header_widgets.close_button,
-                            self.header_widgets.minimize_button,
-                        )
-                        loader.render_loading_screen()
-                        loader.update_stdout_display()
-                        self.ui_manager.update(0.01)
-                        self.ui_manager.draw_ui(self.screen)
-                        pygame.display.flip()
-                        pygame.time.Clock().tick(20)
-
-                    raw_pitch_data = future.result()
-                    save_to_cache(audio_hash, raw_pitch_data)
+            self.screen,
+            int(self.width),
+            int(self.height),
+            Path("assets") / "microtonal-view.png",
+            self.ui_manager,
+        ) as loader, ThreadPoolExecutor(max_workers=2) as executor:
+            try:
+                future_audio = executor.submit(decode_audio, audio_file)
+                audio_hash: str = self.wait_for(
+                    loader, executor.submit(hash_file_cached, audio_file)
+                )
+                pitch_key = cache_key(
+                    audio_hash, self.extraction_parameters, self.processing_parameters
+                )
+                cached_pitch = self.wait_for(
+                    loader, executor.submit(load_pitch_from_cache, pitch_key)
+                )
+                audio = self.wait_for(loader, future_audio)
+                if cached_pitch is not None:
+                    return audio, cached_pitch, None
+
+                # Loudness only depends on the audio, start it before the raw data
+                future_loudness = executor.submit(calculate_loudness, audio, hop_seconds)
+                raw_key = cache_key(audio_hash, self.extraction_parameters)
+                cached_data: pl.DataFrame | None = self.wait_for(
+                    loader, executor.submit(load_from_cache, raw_key)
+                )
+                if cached_data is None:
+                    return audio, *self.stream_pitch(
+                        loader, audio, audio_hash, future_loudness
+                    )
 
+                print("Using cached data...")
                 print("Processing pitch data...")
-                future_process = executor.submit(
-                    process_pitch_data, raw_pitch_data, audio_file
+                processed_pitch_data = annotate_pitch_data_frame(
+                    cached_data,
+                    self.wait_for(loader, future_loudness),
+                    self.processing_parameters,
+                    hop_seconds,
                 )
+                pitch = self.wait_for(
+                    loader,
+                    executor.submit(
+                        build_pitch, processed_pitch_data, self.processing_parameters
+                    ),
+                )
+            except LoadingCancelled:
+                return None
+            save_pitch_to_cache(pitch_key, pitch, source=audio.path)
 
-                # Frame loop: process pitch data
-                while not future_process.done():
-                    handle_header_events(
-                        self.ui_manager,
-                        self.header_widgets.close_button,
-                        self.header_widgets.minimize_button,
-                    )
-                    loader.render_loading_screen()
-                    loader.update_stdout_display()
-                    self.ui_manager.update(0.01)
-                    self.ui_manager.draw_ui(self.screen)
-                    pygame.display.flip()
-                    pygame.time.Clock().tick(20)
-
-                pitch = future_process.result()
+        return audio, pitch, None
 
-        return pitch
+    def stream_pitch(
+        self,
+        loader: loading_screen,
+        audio: DecodedAudio,
+        audio_hash: str,
+        loudness: Future[np.ndarray],
+    ) -> tuple[Pitch, PitchStream | None]:
+        """Start extracting in a PitchStream and wait for its first Pitch.
+
+        Raises LoadingCancelled once a cancelled extraction has stopped.
+        """
+        preview = None
+        preview_key = None
+        if self.preview_engine not in (None, self.extraction_parameters.engine):
+            assert self.preview_engine is not None
+            preview = preview_parameters(self.extraction_parameters, self.preview_engine)
+            preview_key = cache_key(audio_hash, preview)
+
+        pitch_stream = PitchStream(
+            audio,
+            loudness,
+            cache_key(audio_hash, self.extraction_parameters),
+            cache_key(audio_hash, self.extraction_parameters, self.processing_parameters),
+            self.extraction_parameters,
+            self.processing_parameters,
+            preview,
+            preview_key,
+        )
 
-    def display_player(self, pitch: Pitch, audio_file: str) -> ProgramState:
-        """Display the player scene and handle the main loop."""
-        # Initialize audio player
-        audio_segment = AudioSegment.from_wav(audio_file)
-        player = AudioPlayer(audio_segment)
+        # Frame loop: wait for the first chunk of pitch data, or for the
+        # extraction to stop once cancelled
+        cancelled = False
+        first_pitch = None
+        while not pitch_stream.done and (first_pitch is None or cancelled):
+            if self.render_loading_frame(loader, pitch_stream.progress) and not cancelled:
+                print("Cancelling...")
+                pitch_stream.cancel()
+                cancelled = True
+            first_pitch = pitch_stream.poll() or first_pitch
+
+        if cancelled:
+            raise LoadingCancelled
+        if first_pitch is None:
+            raise RuntimeError(f"No pitch could be extracted from {audio.path}")
+        return first_pitch, None if pitch_stream.done else pitch_stream
+
+    def wait_for(self, loader: loading_screen, future: Future[T]) -> T:
+        """Render loading screen frames until the future is done.
+
+        Raises LoadingCancelled when loading is cancelled meanwhile.
+        """
+        while not future.done():
+            if self.render_loading_frame(loader):
+                raise LoadingCancelled
+        return future.result()
+
+    def render_loading_frame(
+        self, loader: loading_screen, progress: ExtractionProgress | None = None
+    ) -> bool:
+        """Render one frame of the loading screen, returns whether to cancel."""
+        cancel = handle_loading_events(
+            self.ui_manager,
+            self.header_widgets.close_button,
+            self.header_widgets.minimize_button,
+            loader.cancel_button,
+        )
+        loader.render_loading_screen()
+        loader.update_progress_display(progress)
+        loader.update_stdout_display()
+        self.ui_manager.update(self.loading_clock.tick(20) / 1000.0)
+        self.ui_manager.draw_ui(self.screen)
+        pygame.display.flip()
+        return cancel
+
+    def display_player(
+        self,
+        pitch: Pitch,
+        audio: DecodedAudio,
+        pitch_stream: PitchStream | None = None,
+    ) -> ProgramState:
+        """Display the player scene and handle the main loop.
+
+        While a pitch stream is still extracting, its newer snapshots replace
+        the displayed pitch data so the visualization fills in during playback.
+        """
+        # Initialize audio player over the already decoded samples
+        player = AudioPlayer(audio, self.av_offset_ms)
         player.play()  # Start playback
+        logger.debug(
+            "Audio output latency %.0f ms, A/V offset %+.0f ms",
+            player.output_latency_ms,
+            player.av_offset_ms,
+        )
 
         # Get music length in seconds
-        music_length = len(audio_segment) / 1000.0
+        music_length = audio.duration
 
         player_view = PlayerView(
             self.screen,
@@ -192,61 +334,90 @@ class SceneManager:
             self.ui_manager,
             pitch,
             music_length,
+            visible_seconds=self.visible_seconds,
         )
 
         program_state = ProgramState.PLAYING
-        clock = pygame.time.Clock()
-
-        lazy_pitch_data = pitch.annotated_pitch_data_frame.lazy()
+        scheduler = FrameScheduler(self.fps)
+        # Time of the last event, the UI may still change for a moment after it
+        last_event_ticks = pygame.time.get_ticks()
 
         # Main loop
         while program_state != ProgramState.TERMINATED:
-            time_delta = clock.tick(25) / 1000.0
-
-            program_state = handle_visualiser_events(
-                self.ui_manager,
-                self.header_widgets.close_button,
-                self.header_widgets.minimize_button,
-                player,
-                player_view.slider,
-                music_length,
-                player_view.play_pause_button,
-                program_state,
-            )
-
-            current_time = player.get_elapsed_time()
-
-            player_view.update_controls(current_time, program_state)
-
-            # Update visuals based on current_time
-            dataframe_window_to_display_lazy = filter_data_by_time_window_lazy(
-                lazy_pitch_data, current_time
-            ).with_columns(
-                [
-                    compute_x_positions_lazy(current_time, player_view.scale_x).alias("x"),
-                    compute_y_positions_lazy(
-                        player_view.usable_height,
-                        player_view.padding_bottom,
-                        pitch.min_frequency,
-                        player_view.scale_y,
-                    ).alias("y"),
-                ]
-            )
-            dataframe_window_to_display = dataframe_window_to_display_lazy.collect()
-
-            # Handle playback
-            if program_state == ProgramState.PLAYING:
-                if not player.is_playing():
-                    player.play(start_time=current_time)
-            elif program_state == ProgramState.PAUSED:
-                if player.is_playing():
-                    player.pause()
-
-            player_view.update_dynamic_elements(dataframe_window_to_display, current_time)
-            player_view.render()
-            self.ui_manager.update(time_delta)
-            self.ui_manager.draw_ui(self.screen)
+            time_delta = scheduler.begin_frame()
+
+            with scheduler.stage("events"):
+                if pygame.event.peek():
+                    last_event_ticks = pygame.time.get_ticks()
+                program_state = handle_visualiser_events(
+                    self.ui_manager,
+                    self.header_widgets.close_button,
+                    self.header_widgets.minimize_button,
+                    player,
+                    player_view.slider,
+                    music_length,
+                    player_view.play_pause_button,
+                    program_state,
+                    player_view.zoom,
+                )
 
-            pygame.display.flip()
+                if pitch_stream is not None:
+                    new_pitch = pitch_stream.poll()
+                    if new_pitch is not None:
+                        pitch = new_pitch
+                        player_view.set_pitch(pitch)
+                    if pitch_stream.done:
+                        pitch_stream = None
+
+            with scheduler.stage("data"):
+                # The audio clock is the one time source of the frame
+                current_time = player.get_elapsed_time()
+                visual_time = current_time + player.av_offset_ms / 1000
+
+                player_view.update_controls(current_time, program_state)
+
+                # Handle playback
+                if program_state == ProgramState.PLAYING:
+                    if not player.is_playing() and not player.finished():
+                        player.play(start_time=current_time)
+                elif program_state == ProgramState.PAUSED:
+                    if player.is_playing() or player.finished():
+                        player.pause()
+                self.ui_manager.update(time_delta)
+
+                # Only query and draw the visuals again when something changed
+                view_changed = player_view.is_stale(visual_time, scheduler.point_stride)
+                ui_changed = (
+                    pygame.time.get_ticks() - last_event_ticks < UI_SETTLE_MS
+                )
+                if view_changed:
+                    # Update visuals based on the time of the audio heard
+                    window = player_view.query_window(visual_time)
+                elif not ui_changed:
+                    scheduler.mark_idle()
+
+            # Over budget frames draw fewer points, or aren't drawn at all
+            if scheduler.should_draw():
+                with scheduler.stage("draw"):
+                    if view_changed:
+                        player_view.update_dynamic_elements(
+                            window, visual_time, scheduler.point_stride
+                        )
+                    player_view.render()
+                    self.ui_manager.draw_ui(self.screen)
+
+                with scheduler.stage("present"):
+                    pygame.display.flip()
+            scheduler.end_frame()
+
+            # A paused, unchanged player sleeps until the next event
+            if not scheduler.should_draw() and program_state == ProgramState.PAUSED:
+                scheduler.wait_for_event()
+
+        logger.debug("Frame pacing: %s", scheduler.report())
 
+        if pitch_stream is not None:
+            pitch_stream.cancel()
+        player.close()
+        player_view.close()
         return program_state
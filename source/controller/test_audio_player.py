@@ -0,0 +1,93 @@
+"""Tests of the playback clock at the end of the file."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from controller import audio_player
+from controller.audio_player import AudioPlayer
+from decoded_audio import DecodedAudio
+
+SAMPLE_RATE = 8000
+
+
+class Clock:
+    """A perf_counter the test moves forward by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(audio_player.time, "perf_counter", clock)
+    return clock
+
+
+def playing_player(frame_count: int, buffer_frames: int) -> AudioPlayer:
+    """A player started at 0, without opening an audio device."""
+    pcm = np.ones((frame_count, 2), dtype=np.int16)
+    audio = DecodedAudio(Path("test.wav"), pcm, SAMPLE_RATE)
+    player = AudioPlayer(audio, buffer_frames=buffer_frames)
+    player.seek(0)
+    player.is_playing_flag = True
+    return player
+
+
+def fill(player: AudioPlayer, clock: Clock) -> bytearray:
+    """Let the output play a buffer, then pull the next one like SDL would."""
+    clock.now += player.buffer_frames / SAMPLE_RATE
+    buffer = bytearray(player.buffer_frames * player.frame_bytes)
+    player._fill(None, memoryview(buffer))
+    return buffer
+
+
+def test_playing_until_the_last_buffer_is_heard(clock):
+    player = playing_player(frame_count=2500, buffer_frames=1000)
+    fill(player, clock)
+    fill(player, clock)
+    last = fill(player, clock)
+    assert player._next_frame == player.frame_count
+    assert any(last[:500 * player.frame_bytes])
+    assert not any(last[500 * player.frame_bytes :])
+
+    # The last frames are handed out but still playing
+    assert player.is_playing()
+    assert not player.finished()
+    assert player.get_elapsed_time() < player.audio.duration
+
+    fill(player, clock)
+    clock.now += player.buffer_frames / SAMPLE_RATE
+    assert not player.is_playing()
+    assert player.finished()
+    assert player.get_elapsed_time() == player.audio.duration
+
+
+def test_seeking_back_after_the_end_plays_again(clock):
+    player = playing_player(frame_count=2000, buffer_frames=1000)
+    for _ in range(3):
+        fill(player, clock)
+    clock.now += player.buffer_frames / SAMPLE_RATE
+    assert player.finished()
+
+    player.seek(0.1)
+    assert player.is_playing()
+    assert not player.finished()
+    assert any(fill(player, clock))
+
+
+def test_finished_while_the_output_keeps_pulling_silence(clock):
+    player = playing_player(frame_count=2500, buffer_frames=1000)
+    for _ in range(3):
+        fill(player, clock)
+    # SDL keeps asking for frames after the end of the file
+    for _ in range(10):
+        assert not any(fill(player, clock))
+    assert player.finished()
+    assert not player.is_playing()
+    assert player.get_elapsed_time() == player.audio.duration
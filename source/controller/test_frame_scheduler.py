@@ -0,0 +1,81 @@
+"""Tests of the frame scheduler's level of detail."""
+
+import pytest
+
+from controller import frame_scheduler
+from controller.frame_scheduler import FrameScheduler
+
+FPS = 200
+
+
+class Clock:
+    """A perf_counter the test moves forward by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(frame_scheduler.time, "perf_counter", clock)
+    return FrameScheduler(FPS)
+
+
+def run_frames(
+    scheduler: FrameScheduler, count: int, work: float, idle: bool = False
+) -> list[bool]:
+    """Run frames taking `work` times the budget, returns whether each was drawn."""
+    clock = frame_scheduler.time.perf_counter
+    assert isinstance(clock, Clock)
+    drawn = []
+    for _ in range(count):
+        scheduler.begin_frame()
+        if idle:
+            scheduler.mark_idle()
+        drawn.append(scheduler.should_draw())
+        if scheduler.should_draw():
+            clock.now += work * scheduler.budget
+        scheduler.end_frame()
+    return drawn
+
+
+def test_slow_frames_simplify_then_skip_drawing(scheduler):
+    run_frames(scheduler, 20, work=0.3)
+    assert scheduler.level == 0
+    assert scheduler.point_stride == 1
+
+    levels = []
+    for _ in range(40):
+        run_frames(scheduler, 1, work=2.0)
+        levels.append(scheduler.level)
+    # Simplified first, then every other frame, never further
+    assert levels.index(1) < levels.index(2)
+    assert max(levels) == FrameScheduler.max_level
+    assert scheduler.point_stride == 2
+    assert run_frames(scheduler, 4, work=2.0) == [True, False, True, False]
+
+
+def test_fast_frames_recover_the_detail(scheduler):
+    run_frames(scheduler, 40, work=2.0)
+    assert scheduler.level == 2
+
+    levels = []
+    for _ in range(60):
+        run_frames(scheduler, 1, work=0.3)
+        levels.append(scheduler.level)
+    assert levels.index(1) < levels.index(0)
+    assert scheduler.level == 0
+    assert all(run_frames(scheduler, 4, work=0.3))
+
+
+def test_idle_frames_keep_the_level(scheduler):
+    run_frames(scheduler, 40, work=2.0)
+    assert scheduler.level == 2
+    drawn = run_frames(scheduler, 100, work=0.0, idle=True)
+    assert not any(drawn)
+    assert scheduler.level == 2
+    assert scheduler.idle_frames == 100
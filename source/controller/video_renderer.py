@@ -0,0 +1,131 @@
+"""Offline rendering of the player scene to a video file."""
+
+import subprocess
+
+import pygame
+import pygame_gui
+
+from caching import (
+    cache_key,
+    hash_file_cached,
+    load_from_cache,
+    load_pitch_from_cache,
+    save_pitch_to_cache,
+    save_to_cache,
+)
+from controller.program_state import ProgramState
+from dataframe_operations import process_pitch_data
+from decoded_audio import DecodedAudio, decode_audio
+from model import ExtractionParameters, Pitch, ProcessingParameters
+from pitch_engines import extract_pitch_data_frame
+from view.player import PlayerView
+
+
+def _load_pitch(
+    audio: DecodedAudio,
+    extraction_parameters: ExtractionParameters,
+    processing_parameters: ProcessingParameters,
+) -> Pitch:
+    """Load the pitch data from the cache or extract it."""
+    audio_hash = hash_file_cached(audio.path)
+    pitch_key = cache_key(audio_hash, extraction_parameters, processing_parameters)
+    pitch = load_pitch_from_cache(pitch_key)
+    if pitch is not None:
+        return pitch
+
+    raw_key = cache_key(audio_hash, extraction_parameters)
+    raw_pitch_data = load_from_cache(raw_key)
+    if raw_pitch_data is None:
+        raw_pitch_data = extract_pitch_data_frame(audio, extraction_parameters)
+        save_to_cache(raw_key, raw_pitch_data, source=audio.path)
+    pitch = process_pitch_data(
+        raw_pitch_data,
+        audio,
+        processing_parameters,
+        extraction_parameters.hop_seconds,
+    )
+    save_pitch_to_cache(pitch_key, pitch, source=audio.path)
+    return pitch
+
+
+def _ffmpeg_command(
+    audio_file: str, output_file: str, width: int, height: int, fps: int, preset: str
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-y",  # Overwrite existing files
+        "-loglevel", "error",
+        # Raw frames piped over stdin
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-video_size", f"{width}x{height}",
+        "-framerate", str(fps),
+        "-i", "-",
+        # Original audio track
+        "-i", audio_file,
+        "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-shortest",
+        output_file,
+    ]
+
+
+def render_video(
+    audio_file: str,
+    output_file: str,
+    width: int = 1920,
+    height: int = 1080,
+    fps: int = 60,
+    preset: str = "veryfast",
+    extraction_parameters: ExtractionParameters | None = None,
+    processing_parameters: ProcessingParameters | None = None,
+) -> None:
+    """Render the player scene frame by frame and encode it with ffmpeg.
+
+    The frames are produced from a virtual clock instead of the audio player,
+    so rendering is not tied to real time and needs no display or sound card
+    when run under the SDL dummy drivers.
+    """
+    if extraction_parameters is None:
+        extraction_parameters = ExtractionParameters()
+    if processing_parameters is None:
+        processing_parameters = ProcessingParameters()
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
+    ui_manager = pygame_gui.UIManager((width, height))
+
+    audio = decode_audio(audio_file)
+    pitch = _load_pitch(audio, extraction_parameters, processing_parameters)
+    music_length = audio.duration
+    player_view = PlayerView(
+        screen, width, height, ui_manager, pitch, music_length
+    )
+
+    frame_count = int(music_length * fps)
+    ffmpeg = subprocess.Popen(
+        _ffmpeg_command(audio_file, output_file, width, height, fps, preset),
+        stdin=subprocess.PIPE,
+    )
+    assert ffmpeg.stdin is not None
+    try:
+        for frame in range(frame_count):
+            current_time = frame / fps
+            pygame.event.pump()
+            player_view.update_controls(current_time, ProgramState.PLAYING)
+            window = player_view.query_window(current_time)
+            player_view.update_dynamic_elements(window, current_time)
+            player_view.render()
+            ui_manager.update(1 / fps)
+            ui_manager.draw_ui(screen)
+            ffmpeg.stdin.write(pygame.image.tobytes(screen, "RGB"))
+
+            if frame % (fps * 10) == 0:
+                print(f"Rendered {current_time:.0f} / {music_length:.0f} seconds...")
+    finally:
+        ffmpeg.stdin.close()
+        ffmpeg.wait()
+        player_view.close()
+        pygame.quit()
+
+    if ffmpeg.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {ffmpeg.returncode}")
@@ -4,7 +4,8 @@ import numpy as np
 import polars as pl
 
 from audio_features import calculate_loudness
-from model import Pitch
+from decoded_audio import DecodedAudio
+from model import Pitch, ProcessingParameters
 
 from scipy.ndimage import gaussian_filter1d
 from scipy.signal import find_peaks
@@ -69,46 +70,52 @@ def find_actual_frequencies_from_peaks(
 
 
 
-def add_loudness(data: pl.DataFrame, loudness: np.ndarray) -> pl.DataFrame:
-    """Add loudness data to the DataFrame."""
-    # Ensure loudness array is not longer than the DataFrame
-    loudness = loudness[: len(data)]
-    return data.with_columns(pl.Series("loudness", loudness))
-
-
-def filter_data_by_time_window_lazy(
-    data: pl.LazyFrame, current_time: float, window_size: float = 2.5
-) -> pl.LazyFrame:
-    """
-    Filter the data to include only rows where the 'time' is within the specified window around the current time.
-
-    Args:
-        data (pl.LazyFrame): The input LazyFrame containing a 'time' column.
-        current_time (float): The current time to filter around.
-        window_size (float): The window size around the current time (default is 2.5 seconds).
-
-    Returns:
-        pl.LazyFrame: The filtered LazyFrame containing rows within the specified time window.
-    """
-    return data.filter(
-        (pl.col("time") >= current_time - window_size)
-        & (pl.col("time") <= current_time + window_size)
+def add_loudness(
+    data: pl.DataFrame, loudness: np.ndarray, hop_seconds: float = 0.01
+) -> pl.DataFrame:
+    """Add the loudness of the frame each row's time falls on."""
+    frames = np.rint(data["time"].to_numpy() / hop_seconds).astype(np.int64)
+    frames = np.clip(frames, 0, len(loudness) - 1)
+    return data.with_columns(pl.Series("loudness", loudness[frames]))
+
+
+def compute_x_positions(
+    time: np.ndarray, current_time: float, scale_x: float, window_size: float = 2.5
+) -> np.ndarray:
+    """Screen x of the points of a window centred on current_time."""
+    return (time - current_time + window_size) * scale_x
+
+
+def compute_y_positions(
+    frequency: np.ndarray,
+    height: int,
+    padding_bottom: int,
+    min_frequency: float,
+    scale_y: float,
+) -> np.ndarray:
+    """Screen y of the points of a window."""
+    return (height - padding_bottom) - (frequency - min_frequency) * scale_y
+
+
+def process_pitch_data(
+    pitch_data: pl.DataFrame,
+    audio: DecodedAudio,
+    parameters: ProcessingParameters | None = None,
+    hop_seconds: float = 0.01,
+) -> Pitch:
+    processed_pitch_data = process_pitch_data_frame(
+        pitch_data, audio, parameters, hop_seconds
     )
+    return build_pitch(processed_pitch_data, parameters)
 
 
-def compute_x_positions_lazy(current_time: float, scale_x: float) -> pl.Expr:
-    return (pl.col("time") - current_time + 2.5) * scale_x
-
-
-def compute_y_positions_lazy(
-    height: int, padding_bottom: int, min_frequency: float, scale_y: float
-) -> pl.Expr:
-    return (height - padding_bottom) - (pl.col("frequency") - min_frequency) * scale_y
-
-
-def process_pitch_data(pitch_data: pl.DataFrame, audio_file: str) -> Pitch:
-    processed_pitch_data = process_pitch_data_frame(pitch_data, audio_file)
-
+def build_pitch(
+    processed_pitch_data: pl.DataFrame,
+    parameters: ProcessingParameters | None = None,
+) -> Pitch:
+    """Compute the statistics and pitch regions of processed pitch data."""
+    if parameters is None:
+        parameters = ProcessingParameters()
     min_frequency = processed_pitch_data["frequency"].min()
     max_frequency = processed_pitch_data["frequency"].max()
 
@@ -118,10 +125,10 @@ def process_pitch_data(pitch_data: pl.DataFrame, audio_file: str) -> Pitch:
     # Extract pitch regions using peak-based method
     clustered_freqs = find_actual_frequencies_from_peaks(
         processed_pitch_data,
-        smoothing_sigma=2.0,
-        peak_prominence=0.05,
-        peak_distance_hz=5.0,
-        freq_tolerance=3.0
+        smoothing_sigma=parameters.smoothing_sigma,
+        peak_prominence=parameters.peak_prominence,
+        peak_distance_hz=parameters.peak_distance_hz,
+        freq_tolerance=parameters.freq_tolerance,
     )
 
     return Pitch(
@@ -134,11 +141,30 @@ def process_pitch_data(pitch_data: pl.DataFrame, audio_file: str) -> Pitch:
     )
 
 
-def process_pitch_data_frame(pitch_data: pl.DataFrame, audio_file: str) -> pl.DataFrame:
+def process_pitch_data_frame(
+    pitch_data: pl.DataFrame,
+    audio: DecodedAudio,
+    parameters: ProcessingParameters | None = None,
+    hop_seconds: float = 0.01,
+) -> pl.DataFrame:
     """Add loudness, filter out rows with low confidence."""
-    loudness = calculate_loudness(audio_file)
-    pitch_data = add_loudness(pitch_data, loudness)
+    loudness = calculate_loudness(audio, hop_seconds)
+    return annotate_pitch_data_frame(pitch_data, loudness, parameters, hop_seconds)
+
+
+def annotate_pitch_data_frame(
+    pitch_data: pl.DataFrame,
+    loudness: np.ndarray,
+    parameters: ProcessingParameters | None = None,
+    hop_seconds: float = 0.01,
+) -> pl.DataFrame:
+    """Add the loudness of each row, filter out rows with low confidence."""
+    if parameters is None:
+        parameters = ProcessingParameters()
+    pitch_data = add_loudness(pitch_data, loudness, hop_seconds)
 
     # Filter out low-confidence pitch data
-    pitch_data = pitch_data.filter(pitch_data["confidence"] > 0.5)
+    pitch_data = pitch_data.filter(
+        pitch_data["confidence"] > parameters.confidence_threshold
+    )
     return pitch_data
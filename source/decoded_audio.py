@@ -0,0 +1,92 @@
+"""Decoding an audio file once for extraction, loudness and playback."""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+import threading
+
+import numpy as np
+import resampy
+import torchcrepe
+from scipy.io import wavfile
+
+
+@dataclass(eq=False)
+class DecodedAudio:
+    """The PCM samples of a WAV file, shared by every consumer of the file.
+
+    `pcm` holds the signed integer samples of the file, shaped (samples,
+    channels), which is the interleaved layout playback expects.
+    The mono float signal at CREPE's sample rate is derived from it once, on
+    first use, so a file opened from the pitch cache is never resampled.
+    """
+
+    path: Path
+    pcm: np.ndarray
+    sample_rate: int
+    _mono_16k: np.ndarray | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    @property
+    def channels(self) -> int:
+        return self.pcm.shape[1]
+
+    @property
+    def sample_width(self) -> int:
+        return self.pcm.dtype.itemsize
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / self.sample_rate
+
+    @property
+    def pcm_bytes(self) -> memoryview:
+        """The interleaved samples as a byte view, without copying them."""
+        return self.pcm.data.cast("B")
+
+    def mono(self) -> np.ndarray:
+        """The samples averaged to mono, as float32 in [-1, 1]."""
+        samples = self.pcm.astype(np.float32)
+        samples /= np.iinfo(self.pcm.dtype).max + 1
+        return samples.mean(axis=1)
+
+    @classmethod
+    def from_mono_16k(cls, path: Path, samples: np.ndarray) -> "DecodedAudio":
+        """Audio known only by its float32 mono samples at CREPE's sample rate.
+
+        For a process given samples resampled elsewhere, which then doesn't
+        decode or resample the file again. `pcm` holds the float samples.
+        """
+        audio = cls(path, samples[:, None], torchcrepe.SAMPLE_RATE)
+        audio._mono_16k = samples
+        return audio
+
+    @property
+    def mono_16k(self) -> np.ndarray:
+        """The mono samples resampled to the sample rate CREPE runs at.
+
+        Computed once, extraction and loudness may ask for it concurrently.
+        """
+        with self._lock:
+            if self._mono_16k is None:
+                mono = self.mono()
+                if self.sample_rate != torchcrepe.SAMPLE_RATE:
+                    mono = resampy.resample(
+                        mono, self.sample_rate, torchcrepe.SAMPLE_RATE
+                    ).astype(np.float32, copy=False)
+                self._mono_16k = mono
+            return self._mono_16k
+
+
+def decode_audio(wav_file: str | Path) -> DecodedAudio:
+    """Read a WAV file into integer PCM samples."""
+    sample_rate, pcm = wavfile.read(wav_file)
+    if pcm.ndim == 1:
+        pcm = pcm[:, np.newaxis]
+    if pcm.dtype.kind == "f":
+        # Float files are played back and analysed as 16 bit PCM
+        pcm = (np.clip(pcm, -1.0, 1.0) * np.iinfo(np.int16).max).astype(np.int16)
+    elif pcm.dtype == np.uint8:
+        pcm = ((pcm.astype(np.int16) - 128) << 8).astype(np.int16)
+    return DecodedAudio(Path(wav_file), pcm, sample_rate)
@@ -0,0 +1,288 @@
+"""Pitch extraction in a child process, sharing its arrays with the parent."""
+
+from collections.abc import Iterator
+import contextlib
+import io
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Event as EventType
+from pathlib import Path
+import sys
+import traceback
+from typing import Any
+
+import numpy as np
+import polars as pl
+
+from caching import load_from_cache, save_to_cache
+from decoded_audio import DecodedAudio
+from model import ExtractionParameters
+from pitch_engines import SAMPLE_RATE, ExtractionCancelled, create_engine
+
+
+class _PipeWriter(io.TextIOBase):
+    """Forwards what the worker prints to the parent, which prints it in turn."""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+
+    def write(self, text: str) -> int:
+        self.connection.send(("output", text))
+        return len(text)
+
+
+def _shared_size(sample_count: int, loudness_count: int, frame_count: int) -> int:
+    """Bytes of a shared block holding the audio and the pitch of a file."""
+    return 4 * (sample_count + loudness_count + 2 * frame_count)
+
+
+def _shared_arrays(
+    shared: SharedMemory, sample_count: int, loudness_count: int, frame_count: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """The samples, loudness, frequency and confidence laid out in the shared block."""
+    buffer: np.ndarray = np.ndarray(
+        (sample_count + loudness_count + 2 * frame_count,),
+        dtype=np.float32,
+        buffer=shared.buf,
+    )
+    frames_start = sample_count + loudness_count
+    return (
+        buffer[:sample_count],
+        buffer[sample_count:frames_start],
+        buffer[frames_start : frames_start + frame_count],
+        buffer[frames_start + frame_count :],
+    )
+
+
+def _work(
+    connection: Connection,
+    cancel: EventType,
+    wav_file: Path,
+    parameters: ExtractionParameters,
+    raw_cache_key: str,
+    preview_parameters: ExtractionParameters | None,
+    preview_cache_key: str | None,
+    log_level: int,
+) -> None:
+    """Entry point of the worker process, reporting the outcome to the parent.
+
+    Waits for the parent to share the audio, as ("audio", block name, sample
+    count, loudness count, frame count). The app's logs at `log_level` and
+    above go to the parent like the output.
+    """
+    sys.stdout = _PipeWriter(connection)
+    logging.basicConfig(format="%(message)s", stream=sys.stdout)
+    logging.getLogger("microtonal_view").setLevel(log_level)
+    try:
+        _, name, sample_count, loudness_count, frame_count = connection.recv()
+    except EOFError:
+        # Closed before the audio was ready
+        connection.close()
+        return
+    shared = SharedMemory(name=name)
+    try:
+        _extract(
+            connection,
+            cancel,
+            _shared_arrays(shared, sample_count, loudness_count, frame_count),
+            wav_file,
+            parameters,
+            raw_cache_key,
+            preview_parameters,
+            preview_cache_key,
+        )
+        connection.send(("done",))
+    except ExtractionCancelled:
+        connection.send(("cancelled",))
+    except BaseException:
+        # The parent raises it in turn, the exit code records the failure
+        connection.send(("error", traceback.format_exc()))
+        raise
+    finally:
+        # The parent unlinks the block once it's done with it. The traceback
+        # of an error may still hold views of the block, which then stays
+        # mapped until the process exits
+        with contextlib.suppress(BufferError):
+            shared.close()
+        connection.close()
+
+
+def _extract(
+    connection: Connection,
+    cancel: EventType,
+    arrays: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    wav_file: Path,
+    parameters: ExtractionParameters,
+    raw_cache_key: str,
+    preview_parameters: ExtractionParameters | None,
+    preview_cache_key: str | None,
+) -> None:
+    """Extract the shared samples into the shared arrays and cache the result.
+
+    Sends ("preview",) once the arrays hold the preview, and the
+    ExtractionProgress after each chunk as ("preview_progress", progress) and
+    ("progress", progress, start, end), where frames start to end are the
+    ones written since the previous chunk. Raises ExtractionCancelled once
+    `cancel` is set.
+    """
+    samples, loudness, frequency, confidence = arrays
+    audio = DecodedAudio.from_mono_16k(wav_file, samples)
+    engine = create_engine(audio, parameters, loudness)
+
+    if preview_parameters is not None and preview_cache_key is not None:
+        print(f"Extracting a {preview_parameters.engine} preview...")
+        preview = load_from_cache(preview_cache_key)
+        if preview is None:
+            preview_engine = create_engine(audio, preview_parameters, loudness)
+            for progress in preview_engine.iter_chunks(cancel.is_set):
+                connection.send(("preview_progress", progress))
+            preview = preview_engine.data_frame()
+            save_to_cache(preview_cache_key, preview, source=wav_file)
+        if len(preview) == engine.frame_count:
+            # Frames not extracted yet keep the preview values
+            engine.frequency[:] = preview["frequency"].to_numpy()
+            engine.confidence[:] = preview["confidence"].to_numpy()
+            frequency[:] = engine.frequency
+            confidence[:] = engine.confidence
+            connection.send(("preview",))
+
+    print("Extracting pitch data...")
+    start = 0
+    for progress in engine.iter_chunks(cancel.is_set):
+        end = progress.frames_done
+        frequency[start:end] = engine.frequency[start:end]
+        confidence[start:end] = engine.confidence[start:end]
+        connection.send(("progress", progress, start, end))
+        start = end
+
+    save_to_cache(raw_cache_key, engine.data_frame(), source=wav_file)
+
+
+class ExtractionWorker:
+    """Extracts the pitch data of a file in a child process.
+
+    Torch, librosa and Polars then don't compete with the UI for the GIL.
+    The process starts, and imports torch, while the parent still decodes
+    the file; `start` then shares the 16 kHz samples and the loudness, so the
+    worker neither decodes nor resamples the file again. Cancelling stops
+    the worker between two batches. Progress and the worker's output come
+    over a pipe; the extracted frames and the preview are written to shared
+    memory the parent reads without copying them through the pipe. The
+    worker caches the raw pitch data.
+    """
+
+    def __init__(
+        self,
+        wav_file: Path,
+        parameters: ExtractionParameters,
+        raw_cache_key: str,
+        preview_parameters: ExtractionParameters | None = None,
+        preview_cache_key: str | None = None,
+    ):
+        self.parameters = parameters
+        self.hop_length = int(SAMPLE_RATE * parameters.hop_seconds)
+        self.frame_count = 0
+        self.frequency: np.ndarray | None = None
+        self.confidence: np.ndarray | None = None
+        self._shared: SharedMemory | None = None
+
+        # Spawned, forking would copy the display and audio threads' state
+        context = multiprocessing.get_context("spawn")
+        self._cancel = context.Event()
+        self._connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_work,
+            args=(
+                child_connection,
+                self._cancel,
+                wav_file,
+                parameters,
+                raw_cache_key,
+                preview_parameters,
+                preview_cache_key,
+                logging.getLogger("microtonal_view").getEffectiveLevel(),
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def start(self, samples: np.ndarray, loudness: np.ndarray) -> None:
+        """Share the 16 kHz samples and their loudness, the worker then extracts."""
+        self.frame_count = 1 + len(samples) // self.hop_length
+        self._shared = SharedMemory(
+            create=True, size=_shared_size(len(samples), len(loudness), self.frame_count)
+        )
+        shared_samples, shared_loudness, self.frequency, self.confidence = (
+            _shared_arrays(self._shared, len(samples), len(loudness), self.frame_count)
+        )
+        shared_samples[:] = samples
+        shared_loudness[:] = loudness
+        self._connection.send(
+            ("audio", self._shared.name, len(samples), len(loudness), self.frame_count)
+        )
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def messages(self) -> Iterator[tuple[Any, ...]]:
+        """Wait for the worker's messages, up to ("done",) or ("cancelled",).
+
+        Raises a RuntimeError when the worker fails.
+        """
+        while True:
+            try:
+                message = self._connection.recv()
+            except EOFError:
+                if self.cancelled:
+                    return
+                raise RuntimeError(
+                    f"The extraction worker exited with code {self.process.exitcode}"
+                )
+            kind = message[0]
+            if kind == "output":
+                print(message[1], end="")
+            elif kind == "error":
+                raise RuntimeError(f"Pitch extraction failed:\n{message[1]}")
+            else:
+                yield message
+                if kind in ("done", "cancelled"):
+                    return
+
+    def data_frame(self, end: int) -> pl.DataFrame:
+        """A copy of the pitch data of the first `end` frames."""
+        assert self.frequency is not None and self.confidence is not None
+        return pl.DataFrame({
+            "time": np.arange(end) * self.hop_length / SAMPLE_RATE,
+            "frequency": self.frequency[:end].copy(),
+            "confidence": self.confidence[:end].copy(),
+        })
+
+    def cancel(self) -> None:
+        """Ask the worker to stop after its current batch."""
+        self._cancel.set()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the worker if it's still running and release the shared memory.
+
+        A worker that doesn't reach its next batch within `timeout` seconds
+        is killed.
+        """
+        self.frequency = self.confidence = None
+        if self._shared is None:
+            # A worker still waiting for the audio stops once the pipe closes
+            self._connection.close()
+        else:
+            self._shared.close()
+            self._shared.unlink()
+            self._shared = None
+        if self.process.is_alive():
+            self._cancel.set()
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self._connection.close()
@@ -0,0 +1,121 @@
+"""Inference backends running the CREPE network on batches of frames."""
+
+from collections.abc import Callable
+from functools import cache
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torchcrepe
+
+from caching import get_cache_directory
+
+BACKENDS = ("torchcrepe", "torchscript", "int8")
+CALIBRATION_FRAMES = 512
+
+
+class _Network(torch.nn.Module):
+    """CREPE without its embedding switch, so that it traces as a graph."""
+
+    def __init__(self, network: torch.nn.Module):
+        super().__init__()
+        self.network = network
+
+    def forward(self, frames: torch.Tensor) -> torch.Tensor:
+        return self.network(frames)
+
+
+def normalize_frames(frames: torch.Tensor) -> torch.Tensor:
+    """Mean-center and scale each frame in place, as torchcrepe does."""
+    frames -= frames.mean(dim=1, keepdim=True)
+    frames /= torch.clamp(frames.std(dim=1, keepdim=True), min=1e-10)
+    return frames
+
+
+def load_network(model: str, device: str) -> torch.nn.Module:
+    """Load a fresh copy of the CREPE network in eval mode."""
+    network = torchcrepe.Crepe(model)
+    weights = os.path.join(os.path.dirname(torchcrepe.__file__), "assets", f"{model}.pth")
+    network.load_state_dict(torch.load(weights, map_location=device, weights_only=True))
+    return network.to(torch.device(device)).eval()
+
+
+def calibration_frames(count: int = CALIBRATION_FRAMES) -> torch.Tensor:
+    """Normalized frames of harmonic tones in noise, spanning CREPE's range."""
+    rng = np.random.default_rng(0)
+    t = np.arange(torchcrepe.WINDOW_SIZE) / torchcrepe.SAMPLE_RATE
+    frequencies = np.geomspace(32.7, 1975.5, count)
+    frames = np.zeros((count, torchcrepe.WINDOW_SIZE), dtype=np.float32)
+    for harmonic in range(1, 6):
+        amplitudes = rng.uniform(0, 1 / harmonic, (count, 1))
+        phases = rng.uniform(0, 2 * np.pi, (count, 1))
+        frames += amplitudes * np.sin(
+            2 * np.pi * harmonic * frequencies[:, None] * t + phases
+        )
+    frames += rng.normal(0, rng.uniform(0, 0.5, (count, 1)), frames.shape)
+    return normalize_frames(torch.from_numpy(frames))
+
+
+def _trace(network: torch.nn.Module, example: torch.Tensor) -> torch.nn.Module:
+    with torch.no_grad():
+        traced = torch.jit.trace(network, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def _quantize(network: torch.nn.Module, example: torch.Tensor) -> torch.nn.Module:
+    """Static int8 post-training quantization of the convolutions and classifier."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    prepared = prepare_fx(
+        network,
+        get_default_qconfig_mapping(torch.backends.quantized.engine),
+        (example,),
+    )
+    with torch.no_grad():
+        prepared(calibration_frames())
+    return convert_fx(prepared)
+
+
+@cache
+def load_backend(
+    backend: str, model: str, device: str
+) -> Callable[[torch.Tensor], torch.Tensor]:
+    """Return a function mapping normalized frames to pitch bin probabilities.
+
+    `torchcrepe` runs the network eagerly through torchcrepe. `torchscript`
+    runs a frozen TorchScript graph with the batch norms folded into the
+    convolutions. `int8` additionally quantizes the weights and activations
+    to int8 and only runs on CPU.
+    """
+    if backend == "torchcrepe":
+        return lambda frames: torchcrepe.infer(frames, model, device)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "int8" and device != "cpu":
+        raise ValueError("The int8 backend only runs on CPU")
+
+    # Tracing and calibrating take a while, the graphs are kept across runs
+    graph_file = (
+        get_cache_directory()
+        / "models"
+        / f"crepe-{model}-{backend}-{device}-torch{torch.__version__}.pt"
+    )
+    if not graph_file.exists():
+        network: torch.nn.Module = _Network(load_network(model, device))
+        example = calibration_frames(16).to(device)
+        if backend == "int8":
+            network = _quantize(network, example)
+        graph_file.parent.mkdir(exist_ok=True)
+        # Parallel workers may trace at once, none loads a half written graph
+        with tempfile.NamedTemporaryFile(
+            dir=graph_file.parent, suffix=".tmp", delete=False
+        ) as f:
+            torch.jit.save(_trace(network, example), f)
+        os.replace(f.name, graph_file)
+
+    # Optimized graphs are specific to the machine and can't be saved
+    return torch.jit.optimize_for_inference(
+        torch.jit.load(graph_file, map_location=device)
+    )
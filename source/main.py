@@ -1,16 +1,73 @@
 import argparse
+import logging
 from pathlib import Path
 import pygame
 import pygame_gui
 from controller.scene_manager import SceneManager
 from controller.program_state import ProgramState
+from inference_backends import BACKENDS
+from pitch_decoders import DECODERS
+from model import ExtractionParameters
+from pitch_engines import ENGINES
 
 
 def main():
     parser = argparse.ArgumentParser(description="Microtonal Pitch Visualisation")
     parser.add_argument("audio", nargs='?', help="Path to the .wav file (optional)")
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=ExtractionParameters.engine,
+        help="Pitch engine to extract with",
+    )
+    parser.add_argument(
+        "--preview-engine",
+        choices=(*ENGINES, "none"),
+        default="yin",
+        help="Fast pitch engine shown while the main engine runs",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="torchcrepe",
+        help="Inference backend of the pitch extraction",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default="viterbi",
+        help="Decoder of the CREPE pitch probabilities",
+    )
+    parser.add_argument(
+        "--av-offset-ms",
+        type=float,
+        default=0.0,
+        help="Shift the visuals relative to the audio, positive shows them earlier",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=60,
+        help="Target frames per second of the player",
+    )
+    parser.add_argument(
+        "--visible-seconds",
+        type=float,
+        default=5.0,
+        help="Seconds of audio across the player, zoom with the mouse wheel or +/-",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print debug details: batch sizes, audio latency and frame pacing",
+    )
     args = parser.parse_args()
     audio_file: str | None = args.audio
+    # Only the app's own debug logs, not those of numba and the like
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("microtonal_view").setLevel(
+        logging.DEBUG if args.verbose else logging.INFO
+    )
 
     icon = pygame.image.load(Path("assets") / "logo.png")
     pygame.display.set_icon(icon)
@@ -30,13 +87,30 @@ def main():
     ui_manager = pygame_gui.UIManager((width, height))
 
     # SceneManager manages the loading of pitch data
-    scene_manager = SceneManager(screen, width, height, ui_manager)
+    scene_manager = SceneManager(
+        screen,
+        width,
+        height,
+        ui_manager,
+        ExtractionParameters(
+            engine=args.engine, backend=args.backend, decoder=args.decoder
+        ),
+        preview_engine=None if args.preview_engine == "none" else args.preview_engine,
+        av_offset_ms=args.av_offset_ms,
+        fps=args.fps,
+        visible_seconds=args.visible_seconds,
+    )
     program_state = ProgramState.MENU
     while program_state != ProgramState.TERMINATED:
         if audio_file is None:
             audio_file = scene_manager.display_menu()
-        pitch = scene_manager.display_loading_screen(audio_file)
-        program_state = scene_manager.display_player(pitch, audio_file)
+        loaded = scene_manager.display_loading_screen(audio_file)
+        if loaded is None:
+            # Cancelled, back to the menu
+            audio_file = None
+            continue
+        audio, pitch, pitch_stream = loaded
+        program_state = scene_manager.display_player(pitch, audio, pitch_stream)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,247 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import numpy as np
 import polars as pl
 
 
+@dataclass(frozen=True)
+class ExtractionParameters:
+    """Parameters of the pitch extraction, part of the cache keys."""
+
+    engine: str = "crepe-full"
+    backend: str = "torchcrepe"
+    decoder: str = "viterbi"
+    hop_seconds: float = 0.01
+    fmin: float = 50.0
+    fmax: float = 1200.0
+    chunk_seconds: float = 10.0
+    # Frames quieter than this (RMS in dBFS) skip the network, None disables
+    silence_threshold_db: float | None = -60.0
+
+
+@dataclass(frozen=True)
+class ProcessingParameters:
+    """Parameters of the pitch post-processing, part of the cache keys."""
+
+    confidence_threshold: float = 0.5
+    smoothing_sigma: float = 2.0
+    peak_prominence: float = 0.05
+    peak_distance_hz: float = 5.0
+    freq_tolerance: float = 3.0
+
+
+@dataclass(frozen=True)
+class ExtractionProgress:
+    """Progress of a pitch extraction, reported after each chunk of audio."""
+
+    engine: str
+    chunk: int
+    chunk_count: int
+    frames_done: int
+    audio_seconds_done: float
+    audio_seconds: float
+    elapsed_seconds: float
+
+    @property
+    def fraction(self) -> float:
+        return self.audio_seconds_done / self.audio_seconds if self.audio_seconds else 1.0
+
+    @property
+    def throughput(self) -> float:
+        """Seconds of audio extracted per second of wall time."""
+        return self.audio_seconds_done / max(self.elapsed_seconds, 1e-9)
+
+    @property
+    def eta_seconds(self) -> float:
+        """Wall time left at the throughput so far."""
+        if self.audio_seconds_done <= 0:
+            return float("inf")
+        return (self.audio_seconds - self.audio_seconds_done) / self.throughput
+
+    def __str__(self) -> str:
+        return (
+            f"{self.engine}: chunk {self.chunk} / {self.chunk_count}, "
+            f"{self.audio_seconds_done:.0f} / {self.audio_seconds:.0f} s of audio, "
+            f"{self.throughput:.1f}x real time, {self.eta_seconds:.0f} s left"
+        )
+
+
+@dataclass(frozen=True)
+class PitchWindow:
+    """Column slices of the pitch data that fall inside a time window."""
+
+    time: np.ndarray
+    frequency: np.ndarray
+    loudness: np.ndarray
+    confidence: np.ndarray
+    base_color: np.ndarray | None = None
+    # Row of the first point in the whole pitch data, or in its level
+    first_row: int = 0
+    # Seconds of frames each point aggregates, 0 for single frames, and the
+    # frequency range of these frames
+    bucket_seconds: float = 0.0
+    min_frequency: np.ndarray | None = None
+    max_frequency: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def every(self, step: int) -> "PitchWindow":
+        """Every step-th row of the whole data, so the same rows as the window slides."""
+        if step == 1:
+            return self
+        rows = slice((-self.first_row) % step, None, step)
+        return PitchWindow(
+            time=self.time[rows],
+            frequency=self.frequency[rows],
+            loudness=self.loudness[rows],
+            confidence=self.confidence[rows],
+            base_color=None if self.base_color is None else self.base_color[rows],
+            first_row=self.first_row + rows.start,
+            bucket_seconds=self.bucket_seconds,
+            min_frequency=(
+                None if self.min_frequency is None else self.min_frequency[rows]
+            ),
+            max_frequency=(
+                None if self.max_frequency is None else self.max_frequency[rows]
+            ),
+        )
+
+
+class PitchLevel:
+    """The pitch data aggregated into buckets of `bucket_seconds`, one point each.
+
+    A point has the mean time, frequency and confidence of its frames, their
+    frequency range and their maximum loudness. Buckets without frames are
+    left out, like the filtered frames they would hold.
+    """
+
+    def __init__(
+        self,
+        time: np.ndarray,
+        frequency: np.ndarray,
+        loudness: np.ndarray,
+        confidence: np.ndarray,
+        bucket_seconds: float,
+    ):
+        self.bucket_seconds = bucket_seconds
+        buckets = np.floor(time / bucket_seconds)
+        self.starts = np.flatnonzero(np.diff(buckets, prepend=-np.inf))
+        self.counts = np.diff(self.starts, append=len(time))
+        self.time = np.add.reduceat(time, self.starts) / self.counts
+        self.frequency = np.add.reduceat(frequency, self.starts) / self.counts
+        self.min_frequency = np.minimum.reduceat(frequency, self.starts)
+        self.max_frequency = np.maximum.reduceat(frequency, self.starts)
+        self.loudness = np.maximum.reduceat(loudness, self.starts)
+        self.confidence = np.add.reduceat(confidence, self.starts) / self.counts
+        self._base_color: np.ndarray | None = None
+        self._frame_base_color: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def base_color(self, frame_base_color: np.ndarray | None) -> np.ndarray | None:
+        """The mean base colour of each bucket, given the colours of the frames."""
+        if frame_base_color is None:
+            return None
+        if frame_base_color is not self._frame_base_color:
+            self._base_color = (
+                np.add.reduceat(frame_base_color, self.starts) / self.counts[:, None]
+            )
+            self._frame_base_color = frame_base_color
+        return self._base_color
+
+
+class TimeIndex:
+    """Time-sorted column arrays of the pitch data for fast window queries.
+
+    Zoomed out windows come from a pyramid of levels, each aggregating
+    buckets twice as long as the previous one, so a window never holds many
+    more points than the screen has pixel columns.
+    """
+
+    # Levels stop once they hold no more points than this
+    min_level_points = 256
+
+    def __init__(self, data: pl.DataFrame):
+        data = data.sort("time")
+        self.time = data["time"].to_numpy()
+        self.frequency = data["frequency"].to_numpy()
+        self.loudness = data["loudness"].to_numpy()
+        self.confidence = data["confidence"].to_numpy()
+        self.base_color: np.ndarray | None = None
+        self.levels = self.build_levels()
+
+    def build_levels(self) -> list[PitchLevel]:
+        """Aggregate the frames into buckets of 2, 4, 8... frame hops."""
+        if len(self.time) <= self.min_level_points:
+            return []
+        frame_seconds = float(np.median(np.diff(self.time)))
+        if frame_seconds <= 0:
+            return []
+        levels: list[PitchLevel] = []
+        bucket_seconds = 2 * frame_seconds
+        while not levels or len(levels[-1]) > self.min_level_points:
+            levels.append(
+                PitchLevel(
+                    self.time,
+                    self.frequency,
+                    self.loudness,
+                    self.confidence,
+                    bucket_seconds,
+                )
+            )
+            bucket_seconds *= 2
+        return levels
+
+    def level_for(self, resolution: float) -> PitchLevel | None:
+        """The coarsest level with buckets of at most `resolution` seconds.
+
+        None when even the finest level is too coarse, the frames themselves.
+        """
+        chosen = None
+        for level in self.levels:
+            if level.bucket_seconds > resolution:
+                break
+            chosen = level
+        return chosen
+
+    def window(
+        self, current_time: float, window_size: float = 2.5, resolution: float = 0.0
+    ) -> PitchWindow:
+        """Return the rows within window_size seconds of current_time as array views.
+
+        The rows come from the coarsest level whose points cover at most
+        `resolution` seconds, e.g. the seconds of a few pixel columns on
+        screen.
+        """
+        level = self.level_for(resolution)
+        source = self if level is None else level
+        start = np.searchsorted(source.time, current_time - window_size, side="left")
+        end = np.searchsorted(source.time, current_time + window_size, side="right")
+        if level is None:
+            base_color = self.base_color
+            return PitchWindow(
+                time=self.time[start:end],
+                frequency=self.frequency[start:end],
+                loudness=self.loudness[start:end],
+                confidence=self.confidence[start:end],
+                base_color=None if base_color is None else base_color[start:end],
+                first_row=int(start),
+            )
+        base_color = level.base_color(self.base_color)
+        return PitchWindow(
+            time=level.time[start:end],
+            frequency=level.frequency[start:end],
+            loudness=level.loudness[start:end],
+            confidence=level.confidence[start:end],
+            base_color=None if base_color is None else base_color[start:end],
+            first_row=int(start),
+            bucket_seconds=level.bucket_seconds,
+            min_frequency=level.min_frequency[start:end],
+            max_frequency=level.max_frequency[start:end],
+        )
+
+
 @dataclass
 class Pitch:
     annotated_pitch_data_frame: pl.DataFrame
@@ -10,3 +250,7 @@ class Pitch:
     max_frequency: float
     min_loudness: float
     max_loudness: float
+    time_index: TimeIndex = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.time_index = TimeIndex(self.annotated_pitch_data_frame)
@@ -0,0 +1,134 @@
+"""Decoders turning CREPE's pitch bin probabilities into a pitch per frame."""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+import torch
+import torchcrepe
+
+DECODERS = ("argmax", "weighted-argmax", "viterbi")
+
+# Cents of pitch bin 0, torchcrepe.convert.bins_to_cents without the dither
+_BIN_0_CENTS = 1997.3794084376191
+
+
+def create_decoder(name: str) -> "PitchDecoder":
+    """Create the decoder of the given name."""
+    if name == "argmax":
+        return ArgmaxDecoder()
+    if name == "weighted-argmax":
+        return WeightedArgmaxDecoder()
+    if name == "viterbi":
+        return ViterbiDecoder()
+    raise ValueError(f"Unknown pitch decoder {name!r}, expected one of {DECODERS}")
+
+
+class PitchDecoder(ABC):
+    """A decoder for torchcrepe.postprocess, fed consecutive batches of frames.
+
+    Called with probabilities shaped (1, 360, frames), it returns the pitch
+    bin and the frequency of every frame. Stateful decoders continue from the
+    previous batch until `reset` marks a gap in the frames.
+    """
+
+    @abstractmethod
+    def __call__(self, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """The pitch bin and the frequency of every frame of the batch."""
+
+    def reset(self) -> None:
+        """Start over, the next batch doesn't follow the previous one."""
+
+
+class ArgmaxDecoder(PitchDecoder):
+    """The most probable bin of each frame, the fastest and noisiest."""
+
+    def __call__(self, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        return torchcrepe.decode.argmax(probabilities)
+
+
+class WeightedArgmaxDecoder(PitchDecoder):
+    """The probability weighted mean of the bins around the most probable one.
+
+    Same result as torchcrepe.decode.weighted_argmax, without its loop over
+    the frames.
+    """
+
+    def __call__(self, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        bins = probabilities.argmax(dim=1)
+        offsets = torch.arange(-4, 5, device=probabilities.device)[None, :, None]
+        window = bins[:, None, :] + offsets
+        inside = (window >= 0) & (window < torchcrepe.PITCH_BINS)
+        window = window.clamp(0, torchcrepe.PITCH_BINS - 1)
+        weights = torch.sigmoid(probabilities.gather(1, window)) * inside
+        cents = torchcrepe.CENTS_PER_BIN * window + _BIN_0_CENTS
+        cents = (weights * cents).sum(dim=1) / weights.sum(dim=1)
+        return bins, torchcrepe.convert.cents_to_frequency(cents)
+
+
+class ViterbiDecoder(PitchDecoder):
+    """Viterbi decoding with torchcrepe's transitions, continued across batches.
+
+    The path scores at the end of a batch are the prior of the next one, so
+    the path doesn't restart at every batch boundary. Each batch is
+    backtracked on its own, the frames of a batch don't change afterwards.
+    Transitions move at most 11 bins per frame, which keeps a step linear in
+    the bins.
+    """
+
+    max_step = 11
+
+    def __init__(self):
+        bins = np.arange(torchcrepe.PITCH_BINS)
+        steps = np.arange(-self.max_step, self.max_step + 1)
+        # transition[i, j] is the probability of going from bin i to bin j
+        transition = np.maximum(
+            self.max_step + 1 - np.abs(bins[:, None] - bins[None, :]), 0
+        ).astype(np.float64)
+        transition /= transition.sum(axis=1, keepdims=True)
+        # Bins each bin can be reached from, and the log probability of it
+        origins = bins[:, None] + steps[None, :]
+        reachable = (origins >= 0) & (origins < torchcrepe.PITCH_BINS)
+        self.origins = origins.clip(0, torchcrepe.PITCH_BINS - 1)
+        with np.errstate(divide="ignore"):
+            self.log_transition = np.where(
+                reachable, np.log(transition[self.origins, bins[:, None]]), -np.inf
+            )
+        self.scores: np.ndarray | None = None
+
+    def reset(self) -> None:
+        self.scores = None
+
+    def __call__(self, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        log_probabilities = (
+            torch.log_softmax(probabilities.double(), dim=1)
+            .squeeze(0)
+            .T.cpu()
+            .numpy()
+        )
+        log_probabilities = np.maximum(log_probabilities, np.log(np.finfo(float).tiny))
+        frame_count = len(log_probabilities)
+        backpointers = np.empty((frame_count, torchcrepe.PITCH_BINS), dtype=np.int64)
+
+        scores = self.scores
+        if scores is None:
+            scores = log_probabilities[0] - np.log(torchcrepe.PITCH_BINS)
+            backpointers[0] = np.arange(torchcrepe.PITCH_BINS)
+            first = 1
+        else:
+            first = 0
+        bins = np.arange(torchcrepe.PITCH_BINS)
+        for frame in range(first, frame_count):
+            candidates = scores[self.origins] + self.log_transition
+            best = candidates.argmax(axis=1)
+            backpointers[frame] = self.origins[bins, best]
+            scores = candidates[bins, best] + log_probabilities[frame]
+        # Keep the scores from drifting towards -inf over long files
+        self.scores = scores - scores.max()
+
+        path = np.empty(frame_count, dtype=np.int64)
+        path[-1] = scores.argmax()
+        for frame in range(frame_count - 1, 0, -1):
+            path[frame - 1] = backpointers[frame, path[frame]]
+
+        path_bins = torch.from_numpy(path)[None].to(probabilities.device)
+        return path_bins, torchcrepe.convert.bins_to_frequency(path_bins)
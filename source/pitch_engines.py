@@ -0,0 +1,469 @@
+"""Pitch tracking engines producing time, frequency and confidence frames."""
+
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
+import logging
+import queue
+import threading
+import time
+from typing import Any
+
+import numpy as np
+import polars as pl
+import torch
+import torchcrepe
+from scipy.ndimage import maximum_filter1d
+
+from audio_features import calculate_gpu_batch_size, calculate_loudness
+from decoded_audio import DecodedAudio
+from inference_backends import load_backend, normalize_frames
+from model import ExtractionParameters, ExtractionProgress
+from pitch_decoders import PitchDecoder, create_decoder
+
+# Debug details, shown with --verbose
+logger = logging.getLogger("microtonal_view")
+
+SAMPLE_RATE = torchcrepe.SAMPLE_RATE
+ENGINES = ("crepe-full", "crepe-tiny", "yin")
+
+
+class ExtractionCancelled(Exception):
+    """Raised by an extraction that was cancelled between two batches."""
+
+
+def create_engine(
+    audio: DecodedAudio,
+    parameters: ExtractionParameters | None = None,
+    loudness: np.ndarray | None = None,
+) -> "PitchEngine":
+    """Create the pitch engine named by the extraction parameters.
+
+    The loudness of the audio on the pitch frame grid, when already known,
+    saves recomputing it for the silence gate.
+    """
+    if parameters is None:
+        parameters = ExtractionParameters()
+    if parameters.engine == "crepe-full":
+        return CrepeEngine(audio, parameters, "full", loudness)
+    if parameters.engine == "crepe-tiny":
+        return CrepeEngine(audio, parameters, "tiny", loudness)
+    if parameters.engine == "yin":
+        return YinEngine(audio, parameters)
+    raise ValueError(f"Unknown pitch engine {parameters.engine!r}, expected one of {ENGINES}")
+
+
+def preview_parameters(
+    parameters: ExtractionParameters, engine: str
+) -> ExtractionParameters:
+    """The parameters of a preview engine, otherwise the same as the main ones."""
+    return replace(parameters, engine=engine, backend=ExtractionParameters.backend)
+
+
+def extract_pitch_data_frame(
+    audio: DecodedAudio,
+    parameters: ExtractionParameters | None = None,
+    on_progress: Callable[[ExtractionProgress], None] | None = None,
+    cancelled: Callable[[], bool] | None = None,
+) -> pl.DataFrame:
+    """Extract pitch data with the configured engine and return a polars DataFrame.
+
+    The progress after each chunk goes to `on_progress`, printed by default.
+    `cancelled` is checked between batches, ExtractionCancelled is raised
+    once it returns True.
+    """
+    engine = create_engine(audio, parameters)
+    for progress in engine.iter_chunks(cancelled):
+        if on_progress is None:
+            print(progress)
+        else:
+            on_progress(progress)
+    return engine.data_frame()
+
+
+def select_device() -> tuple[str, int]:
+    """Pick the inference device and a batch size (in frames) that fits it."""
+    if torch.cuda.is_available():
+        device = "cuda"
+        torch.cuda.empty_cache()
+        # Get total and available GPU memory
+        batch_size = calculate_gpu_batch_size(device)
+    else:
+        device = "cpu"
+        batch_size = 128
+    return device, batch_size
+
+
+class PitchEngine(ABC):
+    """Pitch tracking over a whole file into preallocated output arrays.
+
+    Frame i is centered on sample i * hop of the 16 kHz signal, zero padded at
+    the file edges, so every engine produces the same time grid. Subclasses
+    implement `run`, filling the arrays in order.
+    """
+
+    def __init__(
+        self, audio: DecodedAudio, parameters: ExtractionParameters | None = None
+    ):
+        if parameters is None:
+            parameters = ExtractionParameters()
+        self.parameters = parameters
+        self.samples = audio.mono_16k
+        self.hop_length = int(SAMPLE_RATE * parameters.hop_seconds)
+        self.frame_count = 1 + len(self.samples) // self.hop_length
+        self.time = np.arange(self.frame_count) * self.hop_length / SAMPLE_RATE
+        self.frequency = np.zeros(self.frame_count, dtype=np.float32)
+        self.confidence = np.zeros(self.frame_count, dtype=np.float32)
+        self.frames_done = 0
+
+    def frame_windows(self, window_size: int) -> np.ndarray:
+        """A strided view of the centered window of every frame."""
+        padded = np.pad(self.samples, window_size // 2)
+        return np.lib.stride_tricks.sliding_window_view(padded, window_size)[
+            :: self.hop_length
+        ]
+
+    def data_frame(self, end: int | None = None) -> pl.DataFrame:
+        """The pitch data of the first `end` frames, all extracted ones by default."""
+        end = self.frames_done if end is None else end
+        return pl.DataFrame({
+            "time": self.time[:end],
+            "frequency": self.frequency[:end],
+            "confidence": self.confidence[:end],
+        })
+
+    def iter_chunks(
+        self, cancelled: Callable[[], bool] | None = None
+    ) -> Iterator[ExtractionProgress]:
+        """Run the extraction, yielding the progress after each chunk of audio.
+
+        `cancelled` is checked between batches, ExtractionCancelled is raised
+        once it returns True.
+        """
+        frames_per_chunk = max(
+            1, round(self.parameters.chunk_seconds / self.parameters.hop_seconds)
+        )
+        total_chunks = -(-self.frame_count // frames_per_chunk)
+        audio_seconds = len(self.samples) / SAMPLE_RATE
+        chunks_done = 0
+        start = time.perf_counter()
+        for frames_done in self.run():
+            if cancelled is not None and cancelled():
+                raise ExtractionCancelled
+            if (
+                frames_done >= (chunks_done + 1) * frames_per_chunk
+                or frames_done == self.frame_count
+            ):
+                chunks_done = (
+                    total_chunks
+                    if frames_done == self.frame_count
+                    else frames_done // frames_per_chunk
+                )
+                yield ExtractionProgress(
+                    engine=self.parameters.engine,
+                    chunk=chunks_done,
+                    chunk_count=total_chunks,
+                    frames_done=frames_done,
+                    audio_seconds_done=min(
+                        frames_done * self.hop_length / SAMPLE_RATE, audio_seconds
+                    ),
+                    audio_seconds=audio_seconds,
+                    elapsed_seconds=time.perf_counter() - start,
+                )
+
+    @abstractmethod
+    def run(self) -> Iterator[int]:
+        """Run the extraction, yielding the frames done after each batch."""
+
+
+class CrepeEngine(PitchEngine):
+    """CREPE inference over a whole file, pipelined across three threads.
+
+    A producer thread cuts the signal into normalized frames batch by batch,
+    a model thread runs the network on them back-to-back, and the iterating
+    thread decodes the probabilities into the output arrays with the
+    configured decoder, carrying its state from batch to batch. Frames whose
+    window is quieter than the silence threshold skip the network and get a
+    NaN frequency with zero confidence.
+    """
+
+    def __init__(
+        self,
+        audio: DecodedAudio,
+        parameters: ExtractionParameters | None = None,
+        capacity: str = "full",
+        loudness: np.ndarray | None = None,
+    ):
+        super().__init__(audio, parameters)
+        self.audio = audio
+        self.capacity = capacity
+        self.loudness = loudness
+        self.skipped_frames = 0
+
+    def voiced_frames(self) -> np.ndarray:
+        """Indices of the frames loud enough to run the network on."""
+        threshold_db = self.parameters.silence_threshold_db
+        if threshold_db is None:
+            return np.arange(self.frame_count)
+        loudness = self.loudness
+        if loudness is None:
+            loudness = calculate_loudness(self.audio, self.parameters.hop_seconds)
+        loudness = loudness[: self.frame_count]
+        if len(loudness) < self.frame_count:
+            # Frames past the last hop are as loud as it
+            missing = self.frame_count - len(loudness)
+            loudness = np.pad(loudness, (0, missing), mode="edge")
+        # The loudest hop within reach of the network's window
+        reach = torchcrepe.WINDOW_SIZE // (2 * self.hop_length)
+        window_loudness = maximum_filter1d(loudness, size=2 * reach + 1)
+        return np.flatnonzero(window_loudness >= 10 ** (threshold_db / 20))
+
+    def run(self) -> Iterator[int]:
+        device, batch_size = select_device()
+        logger.debug("Using batch_size: %d", batch_size)
+
+        voiced = self.voiced_frames()
+        self.skipped_frames = self.frame_count - len(voiced)
+        if self.skipped_frames:
+            logger.debug(
+                "Skipping %.0f%% of the frames as silence",
+                100 * self.skipped_frames / self.frame_count,
+            )
+            silent = np.ones(self.frame_count, dtype=bool)
+            silent[voiced] = False
+            self.frequency[silent] = np.nan
+            self.confidence[silent] = 0
+
+        stop = threading.Event()
+        frame_batches: queue.Queue = queue.Queue(maxsize=2)
+        probability_batches: queue.Queue = queue.Queue(maxsize=2)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="crepe")
+        stages = [
+            (
+                executor.submit(
+                    self._produce_frames, voiced, batch_size, device, frame_batches, stop
+                ),
+                frame_batches,
+            ),
+            (
+                executor.submit(
+                    self._infer, device, frame_batches, probability_batches, stop
+                ),
+                probability_batches,
+            ),
+        ]
+        for stage, out in stages:
+            stage.add_done_callback(partial(_forward_error, out=out, stop=stop))
+
+        decoder = create_decoder(self.parameters.decoder)
+        previous_end = 0
+        try:
+            while True:
+                item = _get(probability_batches, stop)
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                indices, probabilities = item
+                # Silent gaps split the batch into runs of consecutive frames,
+                # the decoder starts over after each gap
+                runs = np.flatnonzero(np.diff(indices, prepend=-1) != 1)
+                for start, end in zip(runs, [*runs[1:], len(indices)]):
+                    if indices[start] != previous_end:
+                        decoder.reset()
+                    self._decode(
+                        decoder, indices[start:end], probabilities[:, :, start:end]
+                    )
+                    previous_end = indices[end - 1] + 1
+                # Silent frames up to the last voiced one are done as well
+                self.frames_done = int(indices[-1]) + 1
+                yield self.frames_done
+
+            if self.frames_done < self.frame_count:
+                self.frames_done = self.frame_count
+                yield self.frames_done
+        finally:
+            # Unblocks the threads when the iteration is abandoned
+            stop.set()
+            executor.shutdown(wait=False)
+
+    def _decode(
+        self, decoder: PitchDecoder, indices: np.ndarray, probabilities: torch.Tensor
+    ) -> None:
+        # Decoding edits the probabilities, which inference tensors forbid
+        pitch, periodicity = torchcrepe.postprocess(
+            probabilities.clone(),
+            self.parameters.fmin,
+            self.parameters.fmax,
+            decoder,
+            return_periodicity=True,
+        )
+        self.frequency[indices] = pitch.squeeze(0).cpu().numpy()
+        self.confidence[indices] = periodicity.squeeze(0).cpu().numpy()
+
+    def _produce_frames(
+        self,
+        voiced: np.ndarray,
+        batch_size: int,
+        device: str,
+        out: queue.Queue,
+        stop: threading.Event,
+    ) -> None:
+        windows = self.frame_windows(torchcrepe.WINDOW_SIZE)
+        for start in range(0, len(voiced), batch_size):
+            indices = voiced[start : start + batch_size]
+            frames = torch.from_numpy(windows[indices]).to(device)
+            frames = normalize_frames(frames)
+            if not _put(out, (indices, frames), stop):
+                return
+        _put(out, None, stop)
+
+    def _infer(
+        self,
+        device: str,
+        frame_batches: queue.Queue,
+        out: queue.Queue,
+        stop: threading.Event,
+    ) -> None:
+        infer = load_backend(self.parameters.backend, self.capacity, device)
+        with torch.inference_mode():
+            while True:
+                item = _get(frame_batches, stop)
+                if item is None or isinstance(item, BaseException):
+                    _put(out, item, stop)
+                    return
+                indices, frames = item
+                probabilities = infer(frames)
+                # shape=(1, 360, frames) as torchcrepe.postprocess expects
+                probabilities = probabilities.reshape(
+                    1, -1, torchcrepe.PITCH_BINS
+                ).transpose(1, 2)
+                if not _put(out, (indices, probabilities), stop):
+                    return
+
+
+class YinEngine(PitchEngine):
+    """Vectorized YIN, a fast non-neural tracker for previews.
+
+    The confidence of a frame is one minus the cumulative mean normalized
+    difference at the chosen period, so clear periodic frames are close to
+    one and noise or silence close to zero.
+
+    The periods are those of librosa.yin with the same frame and window
+    lengths. librosa.yin is not used itself because it returns no
+    confidence and takes the whole signal at once, where this engine fills
+    the frames batch by batch for progressive previews.
+    """
+
+    frame_length = 1024
+    window_length = 512
+    batch_size = 2048
+    threshold = 0.1
+
+    def run(self) -> Iterator[int]:
+        windows = self.frame_windows(self.frame_length)
+        min_period = max(2, int(SAMPLE_RATE / self.parameters.fmax))
+        max_period = min(
+            self.frame_length - self.window_length - 1,
+            int(np.ceil(SAMPLE_RATE / self.parameters.fmin)),
+        )
+        for start in range(0, self.frame_count, self.batch_size):
+            end = min(start + self.batch_size, self.frame_count)
+            frames = windows[start:end].astype(np.float64)
+            cmnd = self._cumulative_mean_normalized_difference(frames, max_period)
+            period, aperiodicity = self._pick_periods(cmnd, min_period, max_period)
+            energy = np.sum(frames[:, : self.window_length] ** 2, axis=1)
+            self.frequency[start:end] = SAMPLE_RATE / period
+            self.confidence[start:end] = np.where(
+                energy > 1e-6, np.clip(1 - aperiodicity, 0, 1), 0
+            )
+            self.frames_done = end
+            yield end
+
+    def _cumulative_mean_normalized_difference(
+        self, frames: np.ndarray, max_period: int
+    ) -> np.ndarray:
+        """The YIN difference function of each frame for lags 0 to max_period."""
+        w = self.window_length
+        n_fft = 2 * self.frame_length
+        # Cross-correlation of the first window with the frame at every lag
+        correlation = np.fft.irfft(
+            np.fft.rfft(frames, n_fft) * np.conj(np.fft.rfft(frames[:, :w], n_fft)),
+            n_fft,
+        )[:, : max_period + 1]
+        energy = np.cumsum(np.pad(frames**2, ((0, 0), (1, 0))), axis=1)
+        lagged_energy = energy[:, w : w + max_period + 1] - energy[:, : max_period + 1]
+        difference = lagged_energy[:, :1] + lagged_energy - 2 * correlation
+        difference[:, 0] = 0
+        difference = np.maximum(difference, 0)
+
+        lags = np.arange(1, max_period + 1)
+        cumulative_mean = np.cumsum(difference[:, 1:], axis=1) / lags
+        cmnd = np.ones_like(difference)
+        cmnd[:, 1:] = difference[:, 1:] / np.maximum(cumulative_mean, 1e-12)
+        return cmnd
+
+    def _pick_periods(
+        self, cmnd: np.ndarray, min_period: int, max_period: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """The first trough under the threshold, else the global minimum.
+
+        Returns the period in samples, refined by parabolic interpolation,
+        and the difference at that period.
+        """
+        candidates = cmnd[:, min_period : max_period + 1]
+        troughs = np.zeros_like(candidates, dtype=bool)
+        troughs[:, 1:-1] = (candidates[:, 1:-1] < candidates[:, :-2]) & (
+            candidates[:, 1:-1] <= candidates[:, 2:]
+        )
+        below = troughs & (candidates < self.threshold)
+        index = np.where(
+            below.any(axis=1), below.argmax(axis=1), candidates.argmin(axis=1)
+        )
+        rows = np.arange(len(candidates))
+        aperiodicity = candidates[rows, index]
+
+        # Parabolic interpolation between the neighbouring lags
+        inner = np.clip(index, 1, candidates.shape[1] - 2)
+        left = candidates[rows, inner - 1]
+        center = candidates[rows, inner]
+        right = candidates[rows, inner + 1]
+        curvature = left - 2 * center + right
+        shift = np.divide(
+            0.5 * (left - right),
+            curvature,
+            out=np.zeros_like(curvature),
+            where=curvature != 0,
+        )
+        shift = np.where(inner == index, np.clip(shift, -1, 1), 0)
+        return min_period + index + shift, aperiodicity
+
+
+def _put(out: queue.Queue, item: object, stop: threading.Event) -> bool:
+    """Put an item on a bounded queue, giving up once the pipeline stops."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _forward_error(stage: Future, out: queue.Queue, stop: threading.Event) -> None:
+    """Hand the error of a failed pipeline stage down the pipeline, as its output."""
+    error = stage.exception()
+    if error is not None:
+        _put(out, error, stop)
+
+
+def _get(source: queue.Queue, stop: threading.Event) -> Any:
+    """Get an item from a queue, or None once the pipeline stops."""
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
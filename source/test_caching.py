@@ -0,0 +1,171 @@
+"""Tests of the cache keys, the manifest and the hash index."""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import polars as pl
+import pytest
+
+import caching
+from caching import (
+    MANIFEST_FILE,
+    access_cache_entry,
+    cache_key,
+    evict_cache,
+    get_cache_directory,
+    hash_file_cached,
+    load_from_cache,
+    load_pitch_from_cache,
+    parse_size,
+    prune_hash_index,
+    read_manifest,
+    save_pitch_to_cache,
+    save_to_cache,
+)
+from model import ExtractionParameters, ProcessingParameters
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """A fresh cache directory under a temporary home."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.delenv(caching.CACHE_BUDGET_ENV, raising=False)
+    return tmp_path
+
+
+def data_frame(rows: int = 100) -> pl.DataFrame:
+    return pl.DataFrame({
+        "time": [0.01 * row for row in range(rows)],
+        "frequency": [200.0 + row % 7 for row in range(rows)],
+        "loudness": [-20.0 + row % 5 for row in range(rows)],
+        "confidence": [0.9] * rows,
+    })
+
+
+def test_cache_key_depends_on_the_audio_and_every_parameter():
+    key = cache_key("hash", ExtractionParameters(), ProcessingParameters())
+    assert key == cache_key("hash", ExtractionParameters(), ProcessingParameters())
+    assert key != cache_key("other", ExtractionParameters(), ProcessingParameters())
+    assert key != cache_key(
+        "hash", ExtractionParameters(decoder="argmax"), ProcessingParameters()
+    )
+    assert key != cache_key("hash", ExtractionParameters())
+
+
+def test_parse_size():
+    assert parse_size("500") == 500
+    assert parse_size("2k") == 2048
+    assert parse_size("1.5MB") == 3 * 1024**2 // 2
+    assert parse_size("2G") == 2 * 1024**3
+
+
+def test_save_and_load():
+    save_to_cache("raw", data_frame(), source="song.wav")
+    assert load_from_cache("raw").equals(data_frame())
+    assert load_from_cache("missing") is None
+    assert read_manifest()["raw"]["source"].endswith("song.wav")
+
+
+def test_files_deleted_behind_the_manifest_are_a_miss():
+    save_to_cache("raw", data_frame())
+    (get_cache_directory() / "raw.parquet").unlink()
+    assert load_from_cache("raw") is None
+    assert "raw" not in read_manifest()
+
+
+def test_lookups_only_write_the_manifest_when_an_entry_changes(monkeypatch):
+    save_to_cache("raw", data_frame())
+    writes = []
+    write_json = caching.write_json
+    monkeypatch.setattr(
+        caching, "write_json", lambda path, data: (writes.append(path), write_json(path, data))
+    )
+    access_cache_entry("raw")
+    access_cache_entry("missing")
+    assert writes == []
+
+    # An access long enough after the last one is recorded
+    with caching.update_manifest() as manifest:
+        manifest["raw"]["last_access"] -= 2 * caching.ACCESS_TIME_RESOLUTION
+    writes.clear()
+    access_cache_entry("raw")
+    assert len(writes) == 1
+
+
+def test_least_recently_used_entries_are_evicted_to_the_budget(monkeypatch):
+    for key in ("a", "b", "c"):
+        save_to_cache(key, data_frame())
+    with caching.update_manifest() as manifest:
+        for age, key in enumerate(("c", "a", "b")):
+            manifest[key]["last_access"] = 1000.0 - age
+    entry_size = manifest["a"]["size"]
+
+    # "b" is the oldest, "a" next
+    assert evict_cache(2 * entry_size) == ["b"]
+    assert evict_cache(0, keep="c") == ["a"]
+    assert set(read_manifest()) == {"c"}
+    assert not (get_cache_directory() / "b.parquet").exists()
+
+    # Saving enforces the configured budget, keeping the new entry
+    monkeypatch.setenv(caching.CACHE_BUDGET_ENV, str(entry_size))
+    save_to_cache("d", data_frame())
+    assert set(read_manifest()) == {"d"}
+
+
+def test_pitch_round_trip():
+    from dataframe_operations import build_pitch
+
+    pitch = build_pitch(data_frame())
+    save_pitch_to_cache("pitch", pitch)
+    loaded = load_pitch_from_cache("pitch")
+    assert loaded is not None
+    assert loaded.annotated_pitch_data_frame.equals(pitch.annotated_pitch_data_frame)
+    assert loaded.top_k_freq_bins.equals(pitch.top_k_freq_bins)
+    assert loaded.max_loudness == pitch.max_loudness
+
+
+def test_files_cached_without_a_manifest_are_adopted_per_key():
+    from dataframe_operations import build_pitch
+
+    pitch = build_pitch(data_frame())
+    save_pitch_to_cache("pitch", pitch)
+    save_to_cache("raw", data_frame())
+    (get_cache_directory() / MANIFEST_FILE).unlink()
+
+    manifest = read_manifest()
+    assert manifest["pitch"]["files"] == ["pitch.parquet", "pitch.regions.parquet"]
+    assert manifest["raw"]["files"] == ["raw.parquet"]
+    assert len(manifest) == 2
+    loaded = load_pitch_from_cache("pitch")
+    assert loaded is not None
+    assert loaded.max_frequency == pitch.max_frequency
+
+
+def test_hash_index_reuses_hashes_and_forgets_missing_files(tmp_path):
+    wav_file = tmp_path / "song.wav"
+    wav_file.write_bytes(b"audio")
+    other_file = tmp_path / "other.wav"
+    other_file.write_bytes(b"other audio")
+    file_hash = hash_file_cached(wav_file)
+    hash_file_cached(other_file)
+    assert hash_file_cached(wav_file) == file_hash == caching.hash_file(wav_file)
+
+    wav_file.write_bytes(b"changed audio")
+    assert hash_file_cached(wav_file) != file_hash
+
+    other_file.unlink()
+    assert prune_hash_index() == 1
+    assert prune_hash_index() == 0
+
+
+# Spawned workers import this module, which keeps torch out of its imports
+def _save_entries(worker: int) -> None:
+    for entry in range(10):
+        save_to_cache(f"{worker}-{entry}", data_frame(10))
+
+
+def test_concurrent_processes_keep_every_entry():
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=4, mp_context=context) as executor:
+        list(executor.map(_save_entries, range(4)))
+    assert len(read_manifest()) == 40
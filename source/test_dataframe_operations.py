@@ -0,0 +1,21 @@
+"""Tests of the pitch data processing."""
+
+import numpy as np
+import polars as pl
+
+from dataframe_operations import add_loudness
+
+
+def test_add_loudness_takes_the_nearest_frame():
+    loudness = np.array([-60.0, -30.0, -20.0, -10.0])
+    data = pl.DataFrame({"time": [0.0, 0.004, 0.006, 0.0149, 0.03], "frequency": 220.0})
+    annotated = add_loudness(data, loudness, hop_seconds=0.01)
+    assert annotated.columns == ["time", "frequency", "loudness"]
+    assert annotated["loudness"].to_list() == [-60.0, -60.0, -30.0, -30.0, -10.0]
+
+
+def test_add_loudness_clips_times_past_the_edges():
+    loudness = np.array([-40.0, -20.0])
+    data = pl.DataFrame({"time": [-0.02, 0.05, 10.0]})
+    annotated = add_loudness(data, loudness, hop_seconds=0.01)
+    assert annotated["loudness"].to_list() == [-40.0, -20.0, -20.0]
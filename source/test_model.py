@@ -0,0 +1,71 @@
+"""Tests of the time index and its levels."""
+
+import numpy as np
+import polars as pl
+
+from model import TimeIndex
+
+
+def pitch_data(frame_count: int, frame_seconds: float = 1 / 128) -> pl.DataFrame:
+    """Frames with a rising pitch, shuffled so the index has to sort them.
+
+    Frame times and bucket lengths are exact in binary.
+    """
+    rows = np.random.default_rng(0).permutation(frame_count)
+    return pl.DataFrame({
+        "time": rows * frame_seconds,
+        "frequency": 200.0 + rows,
+        "loudness": -float(frame_count) + rows,
+        "confidence": np.full(frame_count, 0.5),
+    })
+
+
+def test_few_frames_have_no_levels():
+    index = TimeIndex(pitch_data(TimeIndex.min_level_points))
+    assert index.levels == []
+    assert index.level_for(1.0) is None
+
+
+def test_levels_double_until_few_points_are_left():
+    index = TimeIndex(pitch_data(1000))
+    assert np.all(np.diff(index.time) > 0)
+    assert [level.bucket_seconds for level in index.levels] == [1 / 64, 1 / 32]
+    assert [len(level) for level in index.levels] == [500, 250]
+
+    level = index.levels[0]
+    np.testing.assert_allclose(level.time[:2], [0.5 / 128, 2.5 / 128])
+    np.testing.assert_allclose(level.frequency[:2], [200.5, 202.5])
+    np.testing.assert_array_equal(level.min_frequency[:2], [200, 202])
+    np.testing.assert_array_equal(level.max_frequency[:2], [201, 203])
+    np.testing.assert_array_equal(level.loudness[:2], [-999, -997])
+
+
+def test_level_for_picks_the_coarsest_level_within_the_resolution():
+    index = TimeIndex(pitch_data(1000))
+    assert index.level_for(0.0) is None
+    assert index.level_for(0.015) is None
+    assert index.level_for(1 / 64) is index.levels[0]
+    assert index.level_for(0.03) is index.levels[0]
+    assert index.level_for(0.05) is index.levels[1]
+    assert index.level_for(10.0) is index.levels[-1]
+
+
+def test_window_of_the_frames():
+    index = TimeIndex(pitch_data(1000))
+    window = index.window(5.0, window_size=0.5)
+    np.testing.assert_array_equal(window.time, np.arange(576, 705) / 128)
+    np.testing.assert_array_equal(window.frequency, 200.0 + np.arange(576, 705))
+    assert window.first_row == 576
+    assert window.bucket_seconds == 0
+    assert window.min_frequency is None
+
+
+def test_window_of_a_level():
+    index = TimeIndex(pitch_data(1000))
+    window = index.window(5.0, window_size=0.5, resolution=0.05)
+    assert window.bucket_seconds == 1 / 32
+    # Buckets of 4 frames, centred on their mean time
+    np.testing.assert_array_equal(window.time, (4 * np.arange(144, 176) + 1.5) / 128)
+    assert window.first_row == 144
+    assert window.min_frequency is not None and window.max_frequency is not None
+    assert np.all(window.max_frequency - window.min_frequency == 3)
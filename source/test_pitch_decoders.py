@@ -0,0 +1,89 @@
+"""Tests of the pitch decoders against the torchcrepe ones."""
+
+import numpy as np
+import pytest
+import torch
+import torchcrepe
+
+from pitch_decoders import DECODERS, PitchDecoder, ViterbiDecoder, create_decoder
+
+# torchcrepe dithers the cents of its bins by up to a bin either way
+DITHER_TOLERANCE = 2 ** (torchcrepe.CENTS_PER_BIN / 1200) - 1
+
+
+def logits(frame_count: int = 300, seed: int = 0) -> torch.Tensor:
+    """Peaked logits shaped (1, 360, frames), following a wandering pitch."""
+    generator = np.random.default_rng(seed)
+    centres = 180 + np.cumsum(generator.normal(0, 3, frame_count))
+    centres = centres.clip(20, torchcrepe.PITCH_BINS - 20)
+    bins = np.arange(torchcrepe.PITCH_BINS)[:, None]
+    values = 8 * np.exp(-0.5 * ((bins - centres[None, :]) / 3) ** 2)
+    values += generator.normal(0, 1, values.shape)
+    return torch.from_numpy(values).float()[None]
+
+
+def decode(decoder, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """Decode with the same dither as any other decoding."""
+    np.random.seed(0)
+    return decoder(probabilities)
+
+
+def test_create_decoder_knows_every_decoder():
+    for name in DECODERS:
+        create_decoder(name)
+    with pytest.raises(ValueError):
+        create_decoder("mean")
+
+
+def test_argmax_matches_torchcrepe():
+    probabilities = logits()
+    bins, frequency = decode(create_decoder("argmax"), probabilities)
+    expected_bins, expected_frequency = decode(torchcrepe.decode.argmax, probabilities)
+    assert torch.equal(bins, expected_bins)
+    torch.testing.assert_close(frequency, expected_frequency)
+
+
+def test_weighted_argmax_matches_torchcrepe():
+    probabilities = logits()
+    # The window is clipped at the edge bins
+    probabilities[0, 0, :5] = 50
+    probabilities[0, -1, 5:10] = 50
+    bins, frequency = create_decoder("weighted-argmax")(probabilities)
+    expected_bins, expected_frequency = torchcrepe.decode.weighted_argmax(
+        probabilities.clone()
+    )
+    assert torch.equal(bins, expected_bins)
+    np.testing.assert_allclose(frequency, expected_frequency, rtol=DITHER_TOLERANCE)
+
+
+def test_viterbi_of_a_whole_file_matches_torchcrepe():
+    probabilities = logits()
+    bins, frequency = decode(ViterbiDecoder(), probabilities)
+    expected_bins, expected_frequency = decode(torchcrepe.decode.viterbi, probabilities)
+    assert torch.equal(bins, expected_bins)
+    torch.testing.assert_close(frequency, expected_frequency)
+
+
+def test_viterbi_continues_across_batches_until_reset():
+    probabilities = logits(seed=1)
+    decoder = ViterbiDecoder()
+    first, _ = decoder(probabilities[..., :150])
+    assert decoder.scores is not None
+    decoder(probabilities[..., 150:])
+
+    decoder.reset()
+    assert decoder.scores is None
+    again, _ = decoder(probabilities[..., :150])
+    assert torch.equal(first, again)
+
+    # Batches longer than a step are smooth across their boundary
+    whole, _ = ViterbiDecoder()(probabilities)
+    second, _ = decoder(probabilities[..., 150:])
+    bins = torch.cat([first, second], dim=1)
+    assert (bins.diff(dim=1).abs() <= ViterbiDecoder.max_step).all()
+    assert (bins != whole).float().mean() < 0.05
+
+
+def test_decoders_must_implement_call():
+    with pytest.raises(TypeError):
+        PitchDecoder()
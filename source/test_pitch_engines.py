@@ -0,0 +1,61 @@
+"""Tests of the pitch engines."""
+
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+from decoded_audio import DecodedAudio
+from model import ExtractionParameters
+from pitch_engines import SAMPLE_RATE, YinEngine, create_engine
+
+
+def sung_note(seconds: float = 4.0, seed: int = 0) -> np.ndarray:
+    """A harmonic tone gliding over an octave with vibrato, pauses and noise."""
+    generator = np.random.default_rng(seed)
+    time = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    frequency = 150 * 2 ** (time / seconds) * (1 + 0.01 * np.sin(2 * np.pi * 5 * time))
+    phase = 2 * np.pi * np.cumsum(frequency) / SAMPLE_RATE
+    signal = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+    signal *= (time % 1.0) < 0.8
+    return 0.3 * signal + 0.01 * generator.normal(size=len(time))
+
+
+def decoded(samples: np.ndarray) -> DecodedAudio:
+    pcm = (samples * 32767).astype(np.int16)[:, None]
+    return DecodedAudio(path=Path("test.wav"), pcm=pcm, sample_rate=SAMPLE_RATE)
+
+
+def test_yin_matches_librosa():
+    samples = sung_note()
+    parameters = ExtractionParameters(engine="yin")
+    engine = create_engine(decoded(samples), parameters)
+    list(engine.run())
+
+    expected = librosa.yin(
+        engine.samples,
+        fmin=parameters.fmin,
+        fmax=parameters.fmax,
+        sr=SAMPLE_RATE,
+        frame_length=YinEngine.frame_length,
+        hop_length=engine.hop_length,
+        trough_threshold=YinEngine.threshold,
+    )
+    assert len(expected) == engine.frame_count
+    voiced = engine.confidence > 0.8
+    assert voiced.mean() > 0.5
+    cents = 1200 * np.abs(np.log2(engine.frequency[voiced] / expected[voiced]))
+    # The periods are refined slightly differently, within a few cents
+    assert np.median(cents) < 10
+    assert np.mean(cents < 20) > 0.98
+
+
+def test_yin_confidence_is_low_on_noise_and_silence():
+    generator = np.random.default_rng(1)
+    samples = np.concatenate([
+        0.3 * generator.normal(size=SAMPLE_RATE), np.zeros(SAMPLE_RATE)
+    ])
+    engine = create_engine(decoded(samples), ExtractionParameters(engine="yin"))
+    list(engine.run())
+    assert np.median(engine.confidence) < 0.5
+    assert (engine.confidence[-50:] == 0).all()
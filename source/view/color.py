@@ -1,10 +1,11 @@
 """Color representations of notes."""
 
-import colorsys
-import math
 from enum import StrEnum
+from functools import cache
 from typing import NamedTuple
 
+import numpy as np
+
 
 class RGB(NamedTuple):
     """Red Green Blue color representation."""
@@ -34,6 +35,9 @@ class VisualEffect(StrEnum):
     SPECTRUM = "spectrum"
 
 
+COLOR_TABLE_SIZE = 4096
+
+
 class Color:
     BLACK = RGBA(0, 0, 0, 255)
     WHITE = RGBA(255, 255, 255, 255)
@@ -45,68 +49,119 @@ class Color:
     BACKGROUND = RGBA(255, 255, 255, 255)
 
 
-def frequency_to_color(frequency: float, min_freq: float, max_freq: float, effect: VisualEffect = VisualEffect.DEFAULT) -> RGB:
-    """Mapping frequency to colour with shader-like effects.
-    
+def hsv_to_rgb_array(
+    hue: np.ndarray, saturation: np.ndarray, value: np.ndarray
+) -> np.ndarray:
+    """Vectorized colorsys.hsv_to_rgb returning an (n, 3) array in the 0-1 range."""
+    hue, saturation, value = np.broadcast_arrays(hue, saturation, value)
+    sector = (hue * 6.0).astype(np.int64)
+    fraction = hue * 6.0 - sector
+    p = value * (1.0 - saturation)
+    q = value * (1.0 - saturation * fraction)
+    t = value * (1.0 - saturation * (1.0 - fraction))
+    sector %= 6
+    red = np.choose(sector, [value, q, p, p, t, value])
+    green = np.choose(sector, [t, value, value, q, p, p])
+    blue = np.choose(sector, [p, p, t, value, value, q])
+    return np.stack([red, green, blue], axis=-1)
+
+
+def frequency_to_color_array(
+    frequency: np.ndarray,
+    min_freq: float,
+    max_freq: float,
+    effect: VisualEffect = VisualEffect.DEFAULT,
+) -> np.ndarray:
+    """Mapping frequencies to colours with shader-like effects.
+
     Args:
-        frequency: The frequency to convert to color
+        frequency: The frequencies to convert to colors
         min_freq: Minimum frequency in the range
         max_freq: Maximum frequency in the range
         effect: Visual effect to apply from VisualEffect enum
-    
+
     Returns:
-        RGB color representing the frequency
+        (n, 3) array of RGB colors in the 0-255 range
     """
-    # Normalize frequency value
-    normalized_value = (frequency - min_freq) / (max_freq - min_freq)
-    
+    # Normalize frequency values
+    normalized_value = (np.asarray(frequency, dtype=np.float64) - min_freq) / (
+        max_freq - min_freq
+    )
+
     if effect == VisualEffect.GRADIENT:
         # Smooth gradient with enhanced saturation at extremes
         hue = normalized_value
-        saturation = 0.7 + 0.3 * math.sin(normalized_value * math.pi)
-        value = 0.85 + 0.15 * math.cos(normalized_value * math.pi * 2)
-    
+        saturation = 0.7 + 0.3 * np.sin(normalized_value * np.pi)
+        value = 0.85 + 0.15 * np.cos(normalized_value * np.pi * 2)
+
     elif effect == VisualEffect.VIBRANT:
         # More vibrant colors with non-linear mapping
-        normalized_value = pow(normalized_value, 0.4)
+        normalized_value = np.power(normalized_value, 0.4)
         hue = normalized_value
-        saturation = 0.9
-        value = 1.0
-    
+        saturation = np.full_like(normalized_value, 0.9)
+        value = np.full_like(normalized_value, 1.0)
+
     elif effect == VisualEffect.PASTEL:
         # Pastel colors with higher brightness and lower saturation
         hue = normalized_value
-        saturation = 0.5 + 0.2 * math.sin(normalized_value * math.pi * 3)
-        value = 0.9 + 0.1 * math.sin(normalized_value * math.pi * 5)
-    
+        saturation = 0.5 + 0.2 * np.sin(normalized_value * np.pi * 3)
+        value = 0.9 + 0.1 * np.sin(normalized_value * np.pi * 5)
+
     elif effect == VisualEffect.RAINBOW:
         # Rainbow effect with multiple hue cycles
         hue = (normalized_value * 3) % 1.0
-        saturation = 0.8
-        value = 0.9
-    
+        saturation = np.full_like(normalized_value, 0.8)
+        value = np.full_like(normalized_value, 0.9)
+
     elif effect == VisualEffect.SPECTRUM:
         # Physics-inspired spectrum with non-linear mapping
         # Map to visible light spectrum (approximately 380-750nm)
-        normalized_value = pow(normalized_value, 0.5)  # Non-linear mapping
+        normalized_value = np.power(normalized_value, 0.5)  # Non-linear mapping
         hue = normalized_value * 0.8  # Keep within 0-0.8 range for more natural colors
-        saturation = 0.85 + 0.15 * math.sin(normalized_value * math.pi * 4)
-        value = 0.9 + 0.1 * math.sin(normalized_value * math.pi * 8)
-    
+        saturation = 0.85 + 0.15 * np.sin(normalized_value * np.pi * 4)
+        value = 0.9 + 0.1 * np.sin(normalized_value * np.pi * 8)
+
     else:  # default
         # Original effect with slight enhancement
-        normalized_value = pow(normalized_value, 0.4)
+        normalized_value = np.power(normalized_value, 0.4)
         hue = normalized_value
-        saturation = 0.9  # High saturation for more vivid colors
-        value = 0.9       # High value for brightness
+        saturation = np.full_like(normalized_value, 0.9)  # High saturation for more vivid colors
+        value = np.full_like(normalized_value, 0.9)       # High value for brightness
+
+    # Convert HSV to RGB and scale to 0-255 range
+    return hsv_to_rgb_array(hue, saturation, value) * 255
+
 
-    # Convert HSV to RGB
-    rgb = colorsys.hsv_to_rgb(hue, saturation, value)
-    # Scale RGB values to 0-255 range
-    return RGB(rgb[0] * 255, rgb[1] * 255, rgb[2] * 255)
+@cache
+def color_lookup_table(effect: VisualEffect, size: int = COLOR_TABLE_SIZE) -> np.ndarray:
+    """Precompute an effect's colours over normalized frequency as a (size, 3) table."""
+    table = frequency_to_color_array(np.linspace(0.0, 1.0, size), 0.0, 1.0, effect)
+    table.setflags(write=False)
+    return table
 
 
-def blend_color(base_color: RGB, confidence: float) -> RGBA:
-    """Apply alpha based on confidence to the base color."""
-    alpha = int(255 * confidence)
-    return RGBA(base_color.red, base_color.green, base_color.blue, alpha)
+def lookup_colors(
+    frequency: np.ndarray,
+    min_freq: float,
+    max_freq: float,
+    effect: VisualEffect = VisualEffect.DEFAULT,
+) -> np.ndarray:
+    """Gather the (n, 3) base colours of frequencies from the effect's lookup table.
+
+    Non-finite frequencies get NaN colours, like frequency_to_color_array.
+    """
+    table = color_lookup_table(effect)
+    last = len(table) - 1
+    normalized_value = (frequency - min_freq) / (max_freq - min_freq)
+    finite = np.isfinite(normalized_value)
+    indices = np.zeros(normalized_value.shape, dtype=np.intp)
+    indices[finite] = np.clip(np.rint(normalized_value[finite] * last), 0, last)
+    colors = table[indices]
+    colors[~finite] = np.nan
+    return colors
+
+
+def blend_color_array(base_color: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    """Apply alpha based on confidence to an (n, 3) array of base colors."""
+    alpha = (255 * confidence).astype(np.int64)
+    return np.column_stack([base_color, alpha])
@@ -5,13 +5,25 @@ from pathlib import Path
 import sys
 from typing import Self
 import pygame
+import pygame_gui
+
+from model import ExtractionProgress
 
 
 class loading_screen:
-    """Context manager that displays the loading screen."""
+    """Context manager that displays the loading screen.
+
+    Text is rendered to surfaces only when the printed output or the
+    extraction progress change, frames in between just blit them.
+    """
 
     def __init__(
-        self, screen: pygame.Surface, width: int, height: int, image_path: Path
+        self,
+        screen: pygame.Surface,
+        width: int,
+        height: int,
+        image_path: Path,
+        ui_manager: pygame_gui.UIManager,
     ) -> None:
         self.screen = screen
         self.width = width
@@ -21,17 +33,35 @@ class loading_screen:
         self.rect_color = (50, 50, 50)
         self.text_color = (255, 255, 255)
         self.rect_height = 150
+        self.bar_color = (0, 120, 215)
+        self.bar_height = 8
         self.stdout_buffer = io.StringIO()
         self.loading_image = pygame.image.load(self.image_path)
+        self.ui_manager = ui_manager
+        self.cancel_button: pygame_gui.elements.UIButton | None = None
+        self._rendered_length = -1
+        self._line_surfaces: list[pygame.Surface] = []
+        self._progress: ExtractionProgress | None = None
+        self._progress_surface: pygame.Surface | None = None
 
     def __enter__(self) -> Self:
         self.original_stdout = sys.stdout
         sys.stdout = self.stdout_buffer
+        self.cancel_button = pygame_gui.elements.UIButton(
+            relative_rect=pygame.Rect(
+                (self.width - 160, self.height - self.rect_height - 60), (150, 45)
+            ),
+            text="Cancel",
+            manager=self.ui_manager,
+            object_id="#cancel_button",
+        )
         self.render_loading_screen()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         sys.stdout = self.original_stdout
+        if self.cancel_button is not None:
+            self.cancel_button.kill()
 
     def render_loading_screen(self) -> None:
         self.screen.fill((255, 255, 255))  # Redraw the white background
@@ -45,20 +75,45 @@ class loading_screen:
         self.screen.blit(self.loading_image, position)
 
     def update_stdout_display(self) -> None:
-        """Updates the stdout display element."""
-        stdout_content = self.stdout_buffer.getvalue()
-        lines = stdout_content.splitlines()
-        max_lines = self.rect_height // self.font.get_height()
-        lines_to_display = lines[-max_lines:]
+        """Draw the last printed lines, rendering them again only when they change."""
+        if self.stdout_buffer.tell() != self._rendered_length:
+            self._rendered_length = self.stdout_buffer.tell()
+            max_lines = self.rect_height // self.font.get_height()
+            lines = self.stdout_buffer.getvalue().splitlines()[-max_lines:]
+            self._line_surfaces = [
+                self.font.render(line, True, self.text_color) for line in lines
+            ]
 
         rect = pygame.Rect(
             0, self.height - self.rect_height, self.width, self.rect_height
         )
         pygame.draw.rect(self.screen, self.rect_color, rect)
 
-        for i, line in enumerate(lines_to_display):
-            text_surface = self.font.render(line, True, self.text_color)
+        for i, text_surface in enumerate(self._line_surfaces):
             self.screen.blit(
                 text_surface,
                 (10, self.height - self.rect_height + i * self.font.get_height()),
             )
+
+    def update_progress_display(self, progress: ExtractionProgress | None) -> None:
+        """Draw a progress bar and line above the output, if there is progress."""
+        if progress != self._progress:
+            self._progress = progress
+            self._progress_surface = (
+                None
+                if progress is None
+                else self.font.render(str(progress), True, self.rect_color)
+            )
+        if progress is None or self._progress_surface is None:
+            return
+
+        bar_top = self.height - self.rect_height - self.bar_height
+        pygame.draw.rect(
+            self.screen,
+            self.bar_color,
+            pygame.Rect(0, bar_top, int(self.width * progress.fraction), self.bar_height),
+        )
+        self.screen.blit(
+            self._progress_surface,
+            (10, bar_top - self._progress_surface.get_height() - 10),
+        )
@@ -1,27 +1,36 @@
 """PlayerView module that handles the rendering of the player scene."""
 
+from concurrent.futures import Future, ThreadPoolExecutor
 import pygame
 from pathlib import Path
+import numpy as np
 import pygame_gui
-import polars as pl
 
-from view.color import Color, VisualEffect
+from dataframe_operations import compute_x_positions, compute_y_positions
+from model import Pitch, PitchWindow
+from view.color import Color, VisualEffect, lookup_colors
 from view.porte import draw_frequency_regions
-from view.shape import Circle
+from view.shape import compute_colors, loudness_to_size, loudness_to_size_array
+from view.sprite import CircleSpriteCache
 from controller.program_state import ProgramState
 
 
 class PlayerView:
+    # Pixel columns a point of a time index level may span, so views zoomed
+    # out to a few tens of seconds draw levels rather than every frame
+    max_bucket_pixels = 2.0
+
     def __init__(
         self,
         screen: pygame.Surface,
         width: float,
         height: float,
         ui_manager: pygame_gui.UIManager,
-        pitch,
+        pitch: Pitch,
         music_length: float,
         padding_percent: float = 0.15,
         top_area_height: int = 60,
+        visible_seconds: float = 5.0,
     ):
         """Initialize the PlayerView."""
         self.screen = screen
@@ -34,24 +43,93 @@ class PlayerView:
         self.top_area_height = top_area_height
         self.usable_height = self.height - self.top_area_height
         self.padding_bottom = int(self.usable_height * self.padding_percent)
-        self.scale_y = (self.usable_height - self.padding_bottom) / (
-            self.pitch.max_frequency - self.pitch.min_frequency
-        )
-        self.scale_x = self.width / 5
+        # Seconds of audio across the screen, zoomed by the user
+        self.min_visible_seconds = 1.0
+        self.max_visible_seconds = max(visible_seconds, 2 * music_length)
+        self.set_visible_seconds(visible_seconds)
         self.static_elements_surface = pygame.Surface(
             (self.width, self.usable_height), pygame.SRCALPHA
         )
         self.dynamic_elements_surface = pygame.Surface(
             (self.width, self.usable_height), pygame.SRCALPHA
         )
-        self.circle = Circle(0, 0, 0, 0)
+        self.sprite_cache = CircleSpriteCache()
+        self.init_pitch_scales()
+        # Incremental rendering state: the dynamic layer has been scrolled
+        # scroll_offset pixels since it was fully drawn at scroll_origin
+        self.scroll_origin: float | None = None
+        self.scroll_offset = 0
+        self.last_drawn_time: float | None = None
+        self.drawn_base_color: np.ndarray | None = None
+        self.needs_full_redraw = True
+        self.drawn_point_stride = 1
         # Visual effect setting - using enum now
         self.visual_effect = VisualEffect.GRADIENT
+        # Base colours are recomputed off the frame loop when the effect changes
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending_effect: tuple[VisualEffect, Pitch, Future] | None = None
+        self.pitch.time_index.base_color = self.compute_base_colors(
+            self.visual_effect, self.pitch
+        )
 
         # Initialize static elements and controls
         self.init_static_elements()
         self.init_controls()
 
+    def init_pitch_scales(self):
+        """Initialize the scales that depend on the pitch statistics."""
+        self.scale_y = (self.usable_height - self.padding_bottom) / (
+            self.pitch.max_frequency - self.pitch.min_frequency
+        )
+        self.max_circle_size = int(
+            loudness_to_size(
+                self.pitch.max_loudness,
+                self.pitch.min_loudness,
+                self.pitch.max_loudness,
+            )
+        )
+
+    def set_visible_seconds(self, visible_seconds: float):
+        """Zoom the time axis to show `visible_seconds` across the screen."""
+        visible_seconds = min(
+            max(visible_seconds, self.min_visible_seconds), self.max_visible_seconds
+        )
+        self.window_seconds = visible_seconds / 2
+        self.scale_x = self.width / visible_seconds
+        self.needs_full_redraw = True
+
+    def zoom(self, factor: float):
+        """Zoom in by `factor`, or out with a factor below one."""
+        self.set_visible_seconds(2 * self.window_seconds / factor)
+
+    def query_window(self, current_time: float) -> PitchWindow:
+        """The pitch data on screen at current_time.
+
+        At most a point per `max_bucket_pixels` pixel columns once zoomed out
+        to the levels of the time index.
+        """
+        return self.pitch.time_index.window(
+            current_time,
+            self.window_seconds,
+            resolution=self.max_bucket_pixels / self.scale_x,
+        )
+
+    def set_pitch(self, pitch: Pitch):
+        """Display new pitch data, e.g. a newer snapshot of a pitch stream.
+
+        Its base colours are computed in the background like an effect change,
+        until then the points are coloured as the window is drawn.
+        """
+        self.pitch = pitch
+        self.init_pitch_scales()
+        effect = self.visual_effect
+        if self.pending_effect is not None:
+            effect = self.pending_effect[0]
+        self.select_visual_effect(effect)
+        self.static_elements_surface.fill((0, 0, 0, 0))
+        self.init_static_elements()
+        self.needs_full_redraw = True
+
     def init_static_elements(self):
         """Initialize static elements like frequency regions."""
         # Draw mid-line separator
@@ -138,45 +216,237 @@ class PlayerView:
         for event in pygame.event.get(pygame_gui.UI_DROP_DOWN_MENU_CHANGED):
             if event.ui_element == self.effect_dropdown:
                 # Convert string to enum value
-                self.visual_effect = VisualEffect(event.text)
+                self.select_visual_effect(VisualEffect(event.text))
+
+        # Swap in the recomputed base colours once they are ready
+        if self.pending_effect is not None and self.pending_effect[2].done():
+            effect, pitch, future = self.pending_effect
+            self.pending_effect = None
+            if pitch is self.pitch:
+                self.pitch.time_index.base_color = future.result()
+                self.visual_effect = effect
+            else:
+                # The pitch data was replaced while the colours were computed
+                self.select_visual_effect(effect)
+
+    def compute_base_colors(self, effect: VisualEffect, pitch: Pitch) -> np.ndarray:
+        """Compute the base colour of every pitch row for the given effect."""
+        return lookup_colors(
+            pitch.time_index.frequency,
+            pitch.min_frequency,
+            pitch.max_frequency,
+            effect=effect,
+        )
+
+    def select_visual_effect(self, effect: VisualEffect):
+        """Recompute the base colour column for a new effect in the background."""
+        if self.pending_effect is not None:
+            self.pending_effect[2].cancel()
+        self.pending_effect = (
+            effect,
+            self.pitch,
+            self.executor.submit(self.compute_base_colors, effect, self.pitch),
+        )
+
+    def is_stale(self, current_time: float, point_stride: int = 1) -> bool:
+        """Whether the dynamic layer no longer shows this time, data or effect."""
+        return (
+            self.needs_full_redraw
+            or current_time != self.last_drawn_time
+            or point_stride != self.drawn_point_stride
+            or self.pitch.time_index.base_color is not self.drawn_base_color
+        )
 
     def update_dynamic_elements(
-        self, dataframe_window_to_display: pl.DataFrame, current_time: float
+        self, window: PitchWindow, current_time: float, point_stride: int = 1
     ):
-        """Update dynamic elements based on current data."""
-        self.screen.fill(Color.BACKGROUND)
+        """Update dynamic elements based on current data.
+
+        Consecutive frames only slide the window left, so the previous layer is
+        scrolled and just the edges and the current-time marker are redrawn.
+        A seek, an effect change or a large jump falls back to a full redraw.
+        A `point_stride` above one draws only every so many points, for frames
+        that are over budget.
+        """
+        window = window.every(point_stride)
+        if point_stride != self.drawn_point_stride:
+            self.drawn_point_stride = point_stride
+            self.needs_full_redraw = True
+        if (
+            self.needs_full_redraw
+            or self.scroll_origin is None
+            or self.last_drawn_time is None
+            or current_time < self.last_drawn_time
+            or self.pitch.time_index.base_color is not self.drawn_base_color
+        ):
+            self.redraw_all(window, current_time)
+            return
+        if current_time == self.last_drawn_time:
+            return
+
+        offset = round((current_time - self.scroll_origin) * self.scale_x)
+        delta = offset - self.scroll_offset
+        if delta > self.width // 4:
+            self.redraw_all(window, current_time)
+            return
+
+        self.dynamic_elements_surface.scroll(-delta, 0)
+        self.scroll_offset = offset
+        self.last_drawn_time = current_time
+
+        margin = self.max_circle_size + 1
+        marker_margin = margin + int(marker_seconds(window) * self.scale_x) + 1
+        center = int(self.width) // 2
+        strips = [
+            (0, margin),  # circles that slid out of the window
+            (center - delta - marker_margin, center + marker_margin),  # marker
+            (int(self.width) - delta - margin, int(self.width)),  # new points
+        ]
+        self.redraw_strips(window, current_time, strips)
+
+    def redraw_all(self, window: PitchWindow, current_time: float):
+        """Clear the dynamic layer and draw every point in the window."""
+        self.scroll_origin = current_time
+        self.scroll_offset = 0
+        self.last_drawn_time = current_time
+        self.drawn_base_color = self.pitch.time_index.base_color
+        self.needs_full_redraw = False
+
         self.dynamic_elements_surface.fill(
             (0, 0, 0, 0)
         )  # Clear dynamic surface with transparent fill
-        for row in dataframe_window_to_display.iter_rows(named=True):
-            self.circle.time = row["time"]
-            self.circle.frequency = row["frequency"]
-            self.circle.loudness = row["loudness"]
-            self.circle.confidence = row["confidence"]
-
-            circle_size = self.circle.compute_size(
-                self.pitch.min_loudness, self.pitch.max_loudness
-            )
-            color = self.circle.compute_color(
-                current_time, 
-                self.pitch.min_frequency, 
-                self.pitch.max_frequency,
-                effect=self.visual_effect
-            )
+        self.draw_points(*self.layout_points(window, current_time))
 
-            circle_surface = pygame.Surface(
-                (2 * circle_size, 2 * circle_size), pygame.SRCALPHA
+    def redraw_strips(
+        self,
+        window: PitchWindow,
+        current_time: float,
+        strips: list[tuple[int, int]],
+    ):
+        """Clear and redraw the points overlapping vertical strips of the layer."""
+        left_edges, top_edges, sizes, colors, ranges = self.layout_points(
+            window, current_time
+        )
+        right_edges = left_edges + 2 * sizes
+        for left, right in strips:
+            overlapping = (left_edges < right) & (right_edges > left)
+            clip = pygame.Rect(left, 0, right - left, int(self.usable_height))
+            self.dynamic_elements_surface.set_clip(clip)
+            self.dynamic_elements_surface.fill((0, 0, 0, 0))
+            self.draw_points(
+                left_edges[overlapping],
+                top_edges[overlapping],
+                sizes[overlapping],
+                colors[overlapping],
+                None if ranges is None else ranges[overlapping],
             )
-            pygame.draw.circle(
-                circle_surface, color, (circle_size, circle_size), circle_size
+        self.dynamic_elements_surface.set_clip(None)
+
+    def layout_points(
+        self, window: PitchWindow, current_time: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray | None]:
+        """Compute sprite positions, sizes and quantized colours for the window.
+
+        Aggregated points also get the (top, bottom) pixel rows of their
+        frequency range.
+        """
+        assert self.scroll_origin is not None
+        x_positions = (
+            compute_x_positions(
+                window.time, self.scroll_origin, self.scale_x, self.window_seconds
             )
-            self.dynamic_elements_surface.blit(
-                circle_surface,
-                (int(row["x"]) - circle_size, int(row["y"]) - circle_size),
+            - self.scroll_offset
+        )
+        y_positions = compute_y_positions(
+            window.frequency,
+            self.usable_height,
+            self.padding_bottom,
+            self.pitch.min_frequency,
+            self.scale_y,
+        )
+        ranges = None
+        if window.min_frequency is not None and window.max_frequency is not None:
+            ranges = np.column_stack([
+                compute_y_positions(
+                    frequency,
+                    self.usable_height,
+                    self.padding_bottom,
+                    self.pitch.min_frequency,
+                    self.scale_y,
+                )
+                for frequency in (window.max_frequency, window.min_frequency)
+            ]).astype(np.int64)
+        sizes = loudness_to_size_array(
+            window.loudness, self.pitch.min_loudness, self.pitch.max_loudness
+        )
+        base_color = window.base_color
+        if base_color is None:
+            base_color = lookup_colors(
+                window.frequency,
+                self.pitch.min_frequency,
+                self.pitch.max_frequency,
+                effect=self.visual_effect,
             )
+        colors = compute_colors(
+            window.time,
+            base_color,
+            window.confidence,
+            current_time,
+            marker_seconds(window),
+        )
+        colors = self.sprite_cache.quantize(colors)
+        # Whole pixel edges, rounded down, so a circle lands where its copy in a
+        # scrolled layer is; blits truncate towards zero left of the layer
+        left_edges = np.floor(x_positions - sizes).astype(np.int64)
+        top_edges = np.floor(y_positions - sizes).astype(np.int64)
+        return left_edges, top_edges, sizes, colors, ranges
+
+    def draw_points(
+        self,
+        left_edges: np.ndarray,
+        top_edges: np.ndarray,
+        sizes: np.ndarray,
+        colors: np.ndarray,
+        ranges: np.ndarray | None = None,
+    ):
+        """Blit the cached circle sprites of the laid out points.
+
+        Frequency ranges taller than their circle are drawn as a line behind it.
+        """
+        if ranges is not None:
+            tall = ranges[:, 1] - ranges[:, 0] > 2 * sizes
+            for x, (top, bottom), color in zip(
+                np.floor(left_edges + sizes)[tall].astype(np.int64).tolist(),
+                ranges[tall].tolist(),
+                colors[tall].tolist(),
+            ):
+                pygame.draw.line(
+                    self.dynamic_elements_surface, color, (x, top), (x, bottom), 2
+                )
+        get_sprite = self.sprite_cache.get
+        self.dynamic_elements_surface.fblits(
+            [
+                (get_sprite(circle_size, tuple(color)), position)
+                for circle_size, color, position in zip(
+                    sizes.tolist(),
+                    colors.tolist(),
+                    zip(left_edges.tolist(), top_edges.tolist()),
+                )
+            ]
+        )
+
+    def close(self):
+        """Stop the background colour worker."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def render(self):
         """Render the current frame to the screen."""
         # Blit dynamic and static surfaces onto the main screen
+        self.screen.fill(Color.BACKGROUND)
         self.screen.blit(self.dynamic_elements_surface, (0, self.top_area_height))
         self.screen.blit(self.static_elements_surface, (0, self.top_area_height))
+
+
+def marker_seconds(window: PitchWindow) -> float:
+    """Seconds from the current time within which a point is the current one."""
+    return max(0.01, window.bucket_seconds / 2)
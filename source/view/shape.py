@@ -1,31 +1,8 @@
 """Shape objects."""
 
-from view.color import RGBA, Color, VisualEffect, blend_color, frequency_to_color
-
-
-class Circle:
-    def __init__(
-        self, time: float, frequency: float, loudness: float, confidence: float
-    ):
-        self.time = time
-        self.frequency = frequency
-        self.loudness = loudness
-        self.confidence = confidence
-
-    def compute_size(self, min_loudness: float, max_loudness: float):
-        """Computes size using loudness."""
-        return loudness_to_size(self.loudness, min_loudness, max_loudness)
-
-    def compute_color(
-        self, current_time: float, min_frequency: float, max_frequency: float, effect: VisualEffect = VisualEffect.DEFAULT
-    ) -> RGBA:
-        if abs(self.time - current_time) < 0.01:
-            return Color.RED  # current circle red
-        else:
-            base_color = frequency_to_color(
-                self.frequency, min_frequency, max_frequency, effect=effect
-            )
-            return blend_color(base_color, self.confidence)
+import numpy as np
+
+from view.color import Color, blend_color_array
 
 
 def loudness_to_size(
@@ -35,3 +12,25 @@ def loudness_to_size(
     normalized_loudness = (loudness - min_loudness) / (max_loudness - min_loudness)
     res = max(1.8, int(normalized_loudness * 10))
     return res * 2.5  # Scale up to make circles bigger
+
+
+def loudness_to_size_array(
+    loudness: np.ndarray, min_loudness: float, max_loudness: float
+) -> np.ndarray:
+    """Vectorized loudness_to_size over a window of points."""
+    normalized_loudness = (loudness - min_loudness) / (max_loudness - min_loudness)
+    res = np.maximum(1.8, np.trunc(normalized_loudness * 10))
+    return res * 2.5
+
+
+def compute_colors(
+    time: np.ndarray,
+    base_color: np.ndarray,
+    confidence: np.ndarray,
+    current_time: float,
+    marker_seconds: float = 0.01,
+) -> np.ndarray:
+    """Colours of a window of points as an (n, 4) RGBA array, the current one red."""
+    colors = blend_color_array(base_color, confidence)
+    colors[np.abs(time - current_time) < marker_seconds] = Color.RED  # current circle red
+    return colors
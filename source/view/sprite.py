@@ -0,0 +1,44 @@
+"""Pre-rendered sprites for the shapes drawn every frame."""
+
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+
+class CircleSpriteCache:
+    """LRU-bounded cache of circle sprites keyed on size and quantized RGBA."""
+
+    def __init__(
+        self, max_sprites: int = 2048, color_step: int = 8, alpha_step: int = 16
+    ):
+        self.max_sprites = max_sprites
+        self.color_step = color_step
+        self.alpha_step = alpha_step
+        self._sprites: OrderedDict[tuple, pygame.Surface] = OrderedDict()
+
+    def quantize(self, colors: np.ndarray) -> np.ndarray:
+        """Snap an (n, 4) RGBA array to the cache's colour grid."""
+        steps = np.array(
+            [self.color_step, self.color_step, self.color_step, self.alpha_step]
+        )
+        quantized = np.rint(colors / steps) * steps
+        return np.clip(quantized, 0, 255).astype(np.int64)
+
+    def get(self, size: float, color: tuple[int, ...]) -> pygame.Surface:
+        """Return the sprite for a circle of the given radius and colour."""
+        key = (size, *color)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            return sprite
+
+        sprite = pygame.Surface((2 * size, 2 * size), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, color, (size, size), size)
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.max_sprites:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def __len__(self) -> int:
+        return len(self._sprites)
@@ -0,0 +1,20 @@
+"""Tests of the colour lookup."""
+
+import numpy as np
+
+from view.color import VisualEffect, frequency_to_color_array, lookup_colors
+
+
+def test_lookup_colors_match_the_effect():
+    frequency = np.linspace(100, 400, 50)
+    np.testing.assert_allclose(
+        lookup_colors(frequency, 100, 400, VisualEffect.GRADIENT),
+        frequency_to_color_array(frequency, 100, 400, VisualEffect.GRADIENT),
+        atol=1.0,
+    )
+
+
+def test_lookup_colors_of_missing_frequencies_are_nan():
+    colors = lookup_colors(np.array([np.nan, 200.0, np.inf]), 100, 400)
+    assert np.isnan(colors[[0, 2]]).all()
+    np.testing.assert_allclose(colors[1], lookup_colors(np.array([200.0]), 100, 400)[0])
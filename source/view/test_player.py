@@ -0,0 +1,85 @@
+"""Tests of the incremental rendering of the player."""
+
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pygame
+import pygame_gui
+import pytest
+
+from dataframe_operations import build_pitch
+from view.player import PlayerView
+
+WIDTH, HEIGHT = 640, 360
+
+
+@pytest.fixture
+def player_view(monkeypatch):
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    # The control icons load from the assets of the repository root
+    monkeypatch.chdir(Path(__file__).parents[2])
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    ui_manager = pygame_gui.UIManager((WIDTH, HEIGHT))
+
+    # Frame times and pixel scales are exact in binary, so a layer scrolled
+    # by whole pixels can match a full redraw exactly
+    time = np.arange(60 * 128) / 128
+    rng = np.random.default_rng(0)
+    pitch = build_pitch(
+        pl.DataFrame({
+            "time": time,
+            "frequency": 220 + 40 * np.sin(time) + rng.normal(0, 5, len(time)),
+            "loudness": rng.uniform(-40, 0, len(time)),
+            "confidence": rng.uniform(0.5, 1, len(time)),
+        })
+    )
+    view = PlayerView(screen, WIDTH, HEIGHT, ui_manager, pitch, 60.0)
+    yield view
+    view.close()
+    pygame.quit()
+
+
+def layer_bytes(view: PlayerView) -> bytes:
+    return pygame.image.tobytes(view.dynamic_elements_surface, "RGBA")
+
+
+@pytest.mark.parametrize(
+    ("visible_seconds", "frame_seconds", "frame_count"),
+    [
+        (2.5, 1 / 64, 400),  # the frames themselves, 4 px per frame
+        (40.0, 1 / 16, 480),  # aggregated points with their range, 1 px per frame
+    ],
+)
+def test_scrolled_layer_matches_a_full_redraw(
+    player_view, visible_seconds, frame_seconds, frame_count
+):
+    view = player_view
+    view.set_visible_seconds(visible_seconds)
+    view.update_dynamic_elements(view.query_window(0.0), 0.0)
+    for frame in range(1, frame_count):
+        current_time = frame * frame_seconds
+        window = view.query_window(current_time)
+        view.update_dynamic_elements(window, current_time)
+        assert view.scroll_origin == 0.0, "the frames should only scroll"
+        scrolled = layer_bytes(view)
+
+        view.redraw_all(window, current_time)
+        assert layer_bytes(view) == scrolled, f"differs at frame {frame}"
+        # Carry on scrolling from the original origin
+        view.scroll_origin = 0.0
+        view.scroll_offset = round(current_time * view.scale_x)
+        view.dynamic_elements_surface.fill((0, 0, 0, 0))
+        view.draw_points(*view.layout_points(window, current_time))
+
+
+def test_zoomed_out_views_draw_levels(player_view):
+    view = player_view
+    view.set_visible_seconds(2.5)
+    assert view.query_window(30.0).bucket_seconds == 0
+    # A couple of pixel columns per point, not one per column
+    view.set_visible_seconds(10.0)
+    window = view.query_window(30.0)
+    assert 0 < window.bucket_seconds <= view.max_bucket_pixels / view.scale_x
+    assert len(window) <= WIDTH